@@ -0,0 +1,40 @@
+"""
+Archive of the pages a parser saw: recorded during a run and replayed later without network, e.g. to profile
+extractor changes on real pages. Pages are stored zlib-compressed in SQLite, indexed by URL.
+"""
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+
+class PageNotArchived(Exception):
+    """The replayed page was not recorded."""
+
+
+class PageArchive:
+    """Pages by URL with the time they took to fetch. Recording a URL again replaces its page."""
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')  # worker processes of sharded runs record to the same archive
+        self.db.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, html BLOB, latency REAL, '
+                        'recorded REAL)')
+
+    def record(self, url: str, html: str, latency: float):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                            (url, zlib.compress(html.encode('utf-8')), latency, time.time()))
+
+    def get(self, url: str) -> Optional[tuple[str, float]]:
+        """Returns the page and the time it took to fetch, None if the URL was not recorded."""
+        row = self.db.execute('SELECT html, latency FROM pages WHERE url = ?', (url,)).fetchone()
+        return row and (zlib.decompress(row[0]).decode('utf-8'), row[1])
+
+    def urls(self) -> list[str]:
+        return [url for url, in self.db.execute('SELECT url FROM pages ORDER BY recorded')]
+
+    def close(self):
+        self.db.close()
@@ -1,8 +1,5 @@
 from parser import Parser, Product
-
-
-def get_our_price(price: int) -> int:
-    return round(price * 1.25)
+from pricing import PriceRule, PricingRules
 
 
 class Site(Parser):
@@ -10,6 +7,7 @@ class Site(Parser):
     site = 'https://artofchoice.ua/ru/catalog/'
     number_of_workers = 1
     compared_product_field = 'name'
+    pricing_rules = PricingRules(PriceRule(multiplier=1.25))
 
     async def get_categories_links(self, link: str) -> list[str]:
         return [link]
@@ -27,7 +25,7 @@ class Site(Parser):
 
             if name_tag and price_tag:
                 name = name_tag.get_text().strip()
-                price = get_our_price(self.get_price(price_tag.get_text()))
+                price = self.get_price(price_tag.get_text())
                 all_products.append(Product(name=name,
                                             art=name,
                                             available='+',
@@ -0,0 +1,132 @@
+"""
+Micro-benchmark of the extractors of a site on its recorded pages (see archive.py), without network.
+Run: python <site script> --benchmark [html.parser,lxml]
+
+Every parser backend is timed on the same calls of get_categories_links, get_products_links and get_product_info,
+then the calls are repeated with tracemalloc to measure their memory peaks. The results are appended to
+./benchmark/<price_file>.jsonl with the commit and compared with the previous results.
+"""
+import json
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+from archive import PageNotArchived
+
+BENCHMARK_FEATURES = ['html.parser', 'lxml']
+REGRESSION_FACTOR = 1.5  # Slowdown of the median call time reported as a regression
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def get_calls(site) -> list[tuple[str, str]]:
+    """
+    Returns the extractor calls whose pages are in the archive, in the order of a run. Errors of the extractors
+    are raised, otherwise a broken extractor would be timed on fewer pages and look faster.
+    """
+    calls = []
+
+    async def call(method: str, arg: str) -> list:
+        try:
+            result = await getattr(site, method)(arg)
+        except PageNotArchived:
+            return []
+        calls.append((method, arg))
+        return result
+
+    product_links = set()
+    for category_link in filter(site._is_valid_category_link, await call('get_categories_links', site.site)):
+        for link in await call('get_products_links', category_link):
+            if link not in product_links and site._is_valid_link(link):
+                product_links.add(link)
+                await call('get_product_info', link)
+    return calls
+
+
+async def measure(site, calls: list[tuple[str, str]]) -> dict:
+    """Returns the call times and memory peaks of every method."""
+    times, peaks = {}, {}
+    for method, arg in calls:
+        start = time.perf_counter()
+        await getattr(site, method)(arg)
+        times.setdefault(method, []).append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for method, arg in calls:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await getattr(site, method)(arg)
+            peaks.setdefault(method, []).append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        method: {
+            'calls': len(method_times),
+            'pages_per_sec': round(len(method_times) / sum(method_times), 1),
+            'p50_ms': round(percentile(method_times, 0.5) * 1000, 2),
+            'p90_ms': round(percentile(method_times, 0.9) * 1000, 2),
+            'p99_ms': round(percentile(method_times, 0.99) * 1000, 2),
+            'peak_kb': round(sum(peaks[method]) / len(peaks[method]) / 1024, 1),
+        }
+        for method, method_times in times.items()
+    }
+
+
+def find_regressions(results: dict, previous: dict) -> list[str]:
+    regressions = []
+    for features, methods in results.items():
+        for method, stats in methods.items():
+            before = previous.get(features, {}).get(method)
+            if before and stats['p50_ms'] > before['p50_ms'] * REGRESSION_FACTOR:
+                regressions.append(f'{features} {method}: median {before["p50_ms"]} ms -> {stats["p50_ms"]} ms')
+    return regressions
+
+
+async def run_benchmark(site, features_list: list[str]) -> bool:
+    """Benchmarks the site's extractors with every parser backend. Returns False on a regression."""
+    from bs4 import FeatureNotFound
+    calls = await get_calls(site)
+    if not calls:
+        print(f'No recorded pages of {site.site}, record them with --record first')
+        return True
+
+    results = {}
+    for features in features_list:
+        site.soup_features = features
+        try:
+            results[features] = await measure(site, calls)
+        except FeatureNotFound:
+            print(f'Parser backend {features} is not installed, skipped')
+            continue
+        for method, stats in results[features].items():
+            print(f'{features:12} {method:22} {stats["calls"]:5} calls {stats["pages_per_sec"]:8} pages/sec  '
+                  f'p50 {stats["p50_ms"]} ms  p90 {stats["p90_ms"]} ms  p99 {stats["p99_ms"]} ms  '
+                  f'peak {stats["peak_kb"]} KB')
+
+    path = Path(f'./benchmark/{Path(site.price_file).stem}.jsonl')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = path.read_text(encoding='utf-8').splitlines() if path.exists() else []
+    previous = json.loads(lines[-1])['results'] if lines else {}
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'commit': get_commit(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                            'results': results}) + '\n')
+
+    regressions = find_regressions(results, previous)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return not regressions
@@ -0,0 +1,52 @@
+"""
+Long-lived local Chromium shared by the parsing runs over CDP, so that short runs skip the browser launch and reuse
+its warm cache. Every run works in its own browser context. The browser is restarted when it fails a health check.
+
+Run: python browser_service.py [port] [--headed]
+and set Parser.browser_service = 'http://127.0.0.1:9222' in the site scripts.
+"""
+import asyncio
+import json
+import sys
+import urllib.request
+
+from loguru import logger
+
+DEFAULT_PORT = 9222
+HEALTH_CHECK_INTERVAL = 30  # Seconds
+
+
+def is_healthy(endpoint: str, timeout: float = 5) -> bool:
+    """Checks that the browser at the CDP endpoint answers."""
+    try:
+        with urllib.request.urlopen(f'{endpoint}/json/version', timeout=timeout) as r:
+            return 'webSocketDebuggerUrl' in json.load(r)
+    except (OSError, ValueError):
+        return False
+
+
+async def serve(port: int, headless: bool):
+    from playwright.async_api import async_playwright
+    endpoint = f'http://127.0.0.1:{port}'
+    async with async_playwright() as playwright:
+        while True:
+            browser = await playwright.chromium.launch(headless=headless, args=[f'--remote-debugging-port={port}'])
+            logger.info(f'Browser service is listening at {endpoint}')
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            while browser.is_connected() and await asyncio.to_thread(is_healthy, endpoint):
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            logger.warning('Browser service failed the health check, restarting the browser')
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.warning(f'Error closing the browser {str(e)}')
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    port = int(args[0]) if args else DEFAULT_PORT
+    asyncio.run(serve(port, headless='--headed' not in sys.argv))
+
+
+if __name__ == '__main__':
+    main()
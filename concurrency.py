@@ -0,0 +1,85 @@
+"""
+Adaptive concurrency: AIMD control of the number of in-flight requests to a site by their latency and errors.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+OVERLOAD_STATUS_CODES = {429, 503}
+LATENCY_SMOOTHING = 0.2  # Weight of the last response in the smoothed latency
+BASELINE_DRIFT = 0.01  # The lowest latency follows a site that became slower, so it does not stay at the floor
+
+
+def is_overload(e: Exception) -> bool:
+    """Timeouts of httpx, Playwright and asyncio, and 429/503 responses mean the site is overloaded."""
+    response = getattr(e, 'response', None)
+    return 'Timeout' in type(e).__name__ or getattr(response, 'status_code', None) in OVERLOAD_STATUS_CODES
+
+
+class AIMDLimiter:
+    """
+    Limits the in-flight requests. The limit grows by one per limit of healthy responses (additive increase) and
+    is multiplied by backoff on an overload: a timeout, a 429/503 response or the smoothed latency rising above
+    latency_tolerance times the lowest one (multiplicative decrease). Every change is kept in trace.
+    """
+
+    def __init__(self, floor: int = 1, ceiling: int = 10, backoff: float = 0.5, latency_tolerance: float = 2.0,
+                 is_overload=is_overload):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.is_overload = is_overload
+        self.limit = float(floor)
+        self.in_flight = 0
+        self.condition = None  # created in the running event loop
+        self.latency = None
+        self.min_latency = None
+        self.decreased_at = 0.0
+        self.started = time.monotonic()
+        self.trace = [(0.0, floor)]  # (seconds since start, limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Waits for a free slot for one request and adjusts the limit by its outcome."""
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if self.is_overload(e):
+                self._decrease(start)
+            raise
+        else:
+            self._on_success(start, time.monotonic() - start)
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def _on_success(self, start: float, latency: float):
+        self.latency = latency if self.latency is None else self.latency + LATENCY_SMOOTHING * (latency - self.latency)
+        if self.min_latency is None or self.latency < self.min_latency:
+            self.min_latency = self.latency
+        else:
+            self.min_latency += BASELINE_DRIFT * (self.latency - self.min_latency)
+        if self.latency > self.min_latency * self.latency_tolerance:
+            self._decrease(start)
+        else:
+            self._set_limit(self.limit + 1 / self.limit)
+
+    def _decrease(self, start: float):
+        if start < self.decreased_at:  # requests sent before the last decrease are answered at the old limit
+            return
+        self.decreased_at = time.monotonic()
+        self._set_limit(self.limit * self.backoff)
+
+    def _set_limit(self, limit: float):
+        limit = min(max(limit, self.floor), self.ceiling)
+        if int(limit) != int(self.limit):
+            self.trace.append((round(time.monotonic() - self.started, 3), int(limit)))
+        self.limit = limit
@@ -16,7 +16,17 @@ def get_env(var: str) -> str:
 
 load_dotenv(BASE_DIR / '.env')
 
-PROXY_HOST = get_env('PROXY_HOST')
-PROXY_PORT = int(get_env('PROXY_PORT'))
-PROXY_USERNAME = get_env('PROXY_USERNAME')
-PROXY_PASSWORD = get_env('PROXY_PASSWORD')
+# Proxy and session settings are read on first access, so sites without them don't need them set
+LAZY_CONSTANTS = {
+    'PROXY_HOST': lambda: get_env('PROXY_HOST'),
+    'PROXY_PORT': lambda: int(get_env('PROXY_PORT')),
+    'PROXY_USERNAME': lambda: get_env('PROXY_USERNAME'),
+    'PROXY_PASSWORD': lambda: get_env('PROXY_PASSWORD'),
+    'SESSION_KEY': lambda: get_env('SESSION_KEY'),  # Key of the saved sessions, see session_state.py
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_CONSTANTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return LAZY_CONSTANTS[name]()
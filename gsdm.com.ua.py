@@ -1,4 +1,5 @@
 from parser import Parser, Product
+from pricing import PriceRule, PricingRules
 import os
 from dotenv import load_dotenv
 
@@ -10,6 +11,8 @@ class Site(Parser):
     price_file = 'gsdm.xlsx'
     site = 'https://gsdm.com.ua/'
     max_products_per_page = '?limit=500'
+    persist_session = True
+    pricing_rules = PricingRules(PriceRule(multiplier=1.06 * 1.25, rounding='floor'))
     login_data = {
         'email': os.getenv('gsdm_login'),
         'password': os.getenv('gsdm_password')
@@ -19,16 +22,20 @@ class Site(Parser):
     ]
 
     async def login(self, login_data: dict) -> bool:
-        await self.get_soup(self.site)
+        if self.session_restored:  # the login page redirects to the account while the session is valid
+            if 'Мій обліковий запис' in (await self.get_soup(self.site + 'login/')).text:
+                return True
+            self.invalidate_session()
+        else:
+            await self.get_soup(self.site)
         r = await self.client.post(self.site + 'login/', data=login_data)
         return 'Мій обліковий запис' in r.text
 
-    def get_price(self, price_str: str) -> int:
-        return int(super().get_price(price_str) * 1.06 * 1.25)
-
-    async def get_categories_links(self, link: str) -> list[str]:
+    async def prepare(self) -> None:
         if not await self.login(self.login_data):
             raise Exception('Login failed')
+
+    async def get_categories_links(self, link: str) -> list[str]:
         return [link + category for category in self.categories_to_get]
 
     async def get_products_links(self, category_link: str) -> list[str]:
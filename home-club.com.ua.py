@@ -1,4 +1,5 @@
 from parser import Parser, Product
+from pricing import PriceRule, PricingRules
 import re
 
 
@@ -11,6 +12,9 @@ class Site(Parser):
     site = 'https://home-club.com.ua/ua'
     render_javascript = True
     headless = False  # clouflare protection
+    hybrid_rendering = True  # pages are server-rendered once the clearance cookies are set
+    persist_session = True  # keeps the clearance cookies between runs
+    pricing_rules = PricingRules(PriceRule(multiplier=1.27))
     categories_to_get = [
         '/kukhonni-ostrivtsi-ta-vizky',
         '/moduli-na-kolesakh-dlia-vannoi',
@@ -21,9 +25,6 @@ class Site(Parser):
         # '/perenosni-svitylnyky',
     ]
 
-    def get_price(self, price_str: str) -> int:
-        return round(super().get_price(price_str) * 1.27)
-
     async def get_categories_links(self, link: str) -> list[str]:
         for category in self.categories_to_get:
             soup = await self.get_soup(link + category)
@@ -31,18 +32,14 @@ class Site(Parser):
                 raise Exception(f'Category {link + category} not found')
         return [link + category for category in self.categories_to_get]
 
+    def parse_products_links(self, soup) -> list[str]:
+        a_tags = soup.find('div', class_='product-grid').find_all('a')
+        return [self.site + a['href'].removeprefix('/ua') for a in a_tags if a.get('href')]
+
     async def get_products_links(self, category_link: str) -> list[str]:
-        products_links = []
-        page = 1
-        while True:
-            soup = await self.get_soup(f'{category_link}{"" if page == 1 else "?pagenumber=" + str(page)}')
-            a_tags = soup.find('div', class_='product-grid').find_all('a')
-            products_links.extend([self.site + a['href'].removeprefix('/ua') for a in a_tags if a.get('href')])
-            if soup.find('li', class_='next-page'):
-                page += 1
-            else:
-                break
-        return products_links
+        return await self.get_paginated_links(
+            lambda page: f'{category_link}{"" if page == 1 else "?pagenumber=" + str(page)}',
+            self.parse_products_links, is_last_page=lambda soup: not soup.find('li', class_='next-page'))
 
     async def get_product_info(self, product_link: str) -> list[Product]:
         all_products = []
@@ -0,0 +1,183 @@
+# from htmlxls2xlsx import HTMLXLS2XLSX
+# wb = HTMLXLS2XLSX(contents).to_xlsx()
+import codecs
+import re
+from html.parser import HTMLParser
+from openpyxl import Workbook
+
+CHUNK_SIZE = 1024 * 1024
+SNIFF_SIZE = 4096
+OLE2_SIGNATURE = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+
+CHARSET_RE = re.compile(rb'charset\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+INT_RE = re.compile(r'-?(0|[1-9]\d*)')  # no leading zeros: article codes like 00123 stay text
+FLOAT_RE = re.compile(r'-?(0|[1-9]\d*)\.\d+')
+
+# html table tags and their Excel 2003 XML Spreadsheet equivalents
+TABLE_TAGS = {'table'}
+ROW_TAGS = {'tr', 'row'}
+CELL_TAGS = {'td', 'th', 'cell'}
+
+
+def sniff_encoding(head: bytes) -> str:
+    """Guess the encoding of an html document from its BOM or charset declaration"""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if match := CHARSET_RE.search(head):
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def is_html(contents) -> bool:
+    """Check whether xls file contents are actually an html (or xml) document"""
+    head = bytes(contents[:SNIFF_SIZE])
+    if head.startswith(OLE2_SIGNATURE):
+        return False
+    text = head.decode(sniff_encoding(head), errors='ignore')
+    return text.lstrip('\ufeff \t\r\n')[:1] == '<'
+
+
+def html_cell_value(text: str):
+    """Convert the text of an html table cell into an xlsx value"""
+    text = text.strip()
+    if not text:
+        return None
+    if INT_RE.fullmatch(text):
+        return int(text)
+    if FLOAT_RE.fullmatch(text):
+        return float(text)
+    return text
+
+
+class TableParser(HTMLParser):
+    """Incremental parser that collects the rows of top-level tables without building a document tree.
+    Completed rows are appended to self.rows as (table number, sheet name, row tuple)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.depth = 0  # nesting level of tables, only rows of top-level tables are collected
+        self.table_no = 0
+        self.sheet_name = None  # <Worksheet ss:Name> of an xml spreadsheet
+        self.row = None
+        self.cell = None
+        self.colspan = 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'worksheet':
+            self.sheet_name = dict(attrs).get('ss:name')
+        elif tag in TABLE_TAGS:
+            self.depth += 1
+            if self.depth == 1:
+                self.table_no += 1
+        elif self.depth != 1:
+            return
+        elif tag in ROW_TAGS:
+            self.end_row()  # closing tags are optional in html
+            self.row = []
+        elif tag in CELL_TAGS and self.row is not None:
+            self.end_cell()
+            attrs = dict(attrs)
+            if (index := attrs.get('ss:index', '')).isdigit():  # xml spreadsheet skips empty cells
+                self.row.extend([None] * (int(index) - 1 - len(self.row)))
+            if (colspan := attrs.get('colspan', '')).isdigit():
+                self.colspan = int(colspan)
+            elif (merge_across := attrs.get('ss:mergeacross', '')).isdigit():
+                self.colspan = int(merge_across) + 1
+            else:
+                self.colspan = 1
+            self.cell = []
+        elif tag == 'br' and self.cell is not None:
+            self.cell.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in TABLE_TAGS:
+            if self.depth == 1:
+                self.end_row()
+            self.depth = max(self.depth - 1, 0)
+        elif self.depth != 1:
+            return
+        elif tag in ROW_TAGS:
+            self.end_row()
+        elif tag in CELL_TAGS:
+            self.end_cell()
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def end_cell(self):
+        if self.cell is not None:
+            self.row.append(html_cell_value(''.join(self.cell)))
+            self.row.extend([None] * (self.colspan - 1))
+            self.cell = None
+
+    def end_row(self):
+        if self.row is not None:
+            self.end_cell()
+            self.rows.append((self.table_no, self.sheet_name, tuple(self.row)))
+            self.row = None
+
+
+class HTMLXLS2XLSX:
+    """Convert an "xls" file which is really an html table export (or an Excel 2003 xml spreadsheet) into xlsx.
+       The document is parsed incrementally chunk by chunk, so memory stays bounded by the output.
+       Each top-level table becomes a sheet.  Only cell values are converted.
+        """
+
+    def __init__(self, contents, sheets=None, chunk_size=CHUNK_SIZE):
+        """contents is the file contents as bytes or a memory map.
+        sheets is a list of sheet names or indexes to convert only those tables"""
+        self.contents = contents
+        self.sheets = sheets
+        self.chunk_size = chunk_size
+        self.encoding = sniff_encoding(bytes(contents[:SNIFF_SIZE]))
+
+    def iter_rows(self):
+        """Yield (table number, sheet name, row tuple) for every row of every top-level table"""
+        parser = TableParser()
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        for start in range(0, len(self.contents), self.chunk_size):
+            parser.feed(decoder.decode(self.contents[start:start + self.chunk_size]))
+            yield from parser.rows
+            parser.rows.clear()
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        parser.end_row()
+        yield from parser.rows
+
+    def is_selected(self, table_no, sheet_name):
+        return self.sheets is None or table_no - 1 in self.sheets or sheet_name in self.sheets
+
+    def to_xlsx(self, filename=None):
+        """Convert to xlsx using openpyxl.  If filename is not None, then the rows are streamed into
+        a write-only workbook saved to that file, and the filename is returned, else the workbook is returned.
+        """
+        wb = Workbook(write_only=bool(filename))
+        first_ws = None if filename else wb.active
+        ws = None
+        current_table_no = None
+        for table_no, sheet_name, row in self.iter_rows():
+            if not self.is_selected(table_no, sheet_name):
+                continue
+            if table_no != current_table_no:
+                current_table_no = table_no
+                title = sheet_name or f'Sheet{table_no}'
+                if first_ws:
+                    ws, first_ws = first_ws, None
+                    ws.title = title
+                else:
+                    ws = wb.create_sheet(title)
+            ws.append(row)
+
+        if filename:
+            if not wb.worksheets:
+                wb.create_sheet()  # a workbook must have at least one sheet
+            wb.save(filename=filename)
+            return filename
+        return wb
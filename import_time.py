@@ -0,0 +1,40 @@
+"""
+Measures the import time of the parser module and checks it against the budget.
+Usage: python import_time.py [module] [budget_ms]
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+IMPORT_TIME_BUDGET_MS = 300  # Startup share of every short cron run
+TOP_IMPORTS = 10
+
+
+def measure(module: str) -> list[tuple[int, str]]:
+    """Returns (cumulative microseconds, module name) of the top level imports, the slowest first."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        if not name.startswith('  '):  # nested imports are indented
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else 'parser'
+    budget_ms = int(sys.argv[2]) if len(sys.argv) > 2 else IMPORT_TIME_BUDGET_MS
+    imports = measure(module)
+    total_ms = sum(cumulative for cumulative, _ in imports) / 1000
+    for cumulative, name in imports[:TOP_IMPORTS]:
+        print(f'{cumulative / 1000:8.1f} ms  {name}')
+    print(f'Interpreter startup with {module} imported took {total_ms:.1f} ms, budget {budget_ms} ms')
+    if total_ms > budget_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,197 @@
+import atexit
 import os
-import telebot
-from dotenv import load_dotenv
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 
-load_dotenv('/etc/env/tg.env')
-
-admin_tg = os.getenv('admin_tg')
-tg_token_salon = os.getenv('tg_token_salon')
-tg_token_tools = os.getenv('tg_token_tools')
-DO_SEND_TO_BOT = True if os.getenv('DO_SEND_TO_BOT') == 'True' else False
+TG_ENV_FILE = '/etc/env/tg.env'
 TG_MAX_MESSAGE_LENGTH = 4096
+TG_MESSAGES_PER_MINUTE = 20  # Telegram limit for messages to the same chat
+DIGEST_INTERVAL = 60  # Seconds during which similar service messages are coalesced into one digest
+USER_SEND_THREADS = 4
+
+
+@cache
+def get_env(name: str) -> str | None:
+    """Reads the env file on first use instead of on import."""
+    from dotenv import load_dotenv
+    load_dotenv(TG_ENV_FILE)
+    return os.getenv(name)
+
+
+def do_send_to_bot() -> bool:
+    return get_env('DO_SEND_TO_BOT') == 'True'
+
+
+@cache
+def get_bot(token_name: str):
+    """Creates the bot on first use, telebot is imported only then."""
+    import telebot
+    return telebot.TeleBot(get_env(token_name))
+
+
+# Module attributes of the previous versions, resolved on first access
+LAZY_ATTRIBUTES = {
+    'admin_tg': lambda: get_env('admin_tg'),
+    'tg_token_salon': lambda: get_env('tg_token_salon'),
+    'tg_token_tools': lambda: get_env('tg_token_tools'),
+    'DO_SEND_TO_BOT': do_send_to_bot,
+    'bot': lambda: get_bot('tg_token_salon'),
+    'bot_tools': lambda: get_bot('tg_token_tools'),
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return LAZY_ATTRIBUTES[name]()
+
+
+class TelebotTransport:
+    """Sends messages with a telebot bot."""
+
+    def __init__(self, tg_bot):
+        self.bot = tg_bot
+
+    def send(self, chat_id, text: str):
+        self.bot.send_message(chat_id, text)
+
+
+class NullTransport:
+    """Drops messages, when DO_SEND_TO_BOT is off."""
+
+    def send(self, chat_id, text: str):
+        pass
+
+
+class StubTransport:
+    """Collects messages instead of sending them, for tests."""
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.sent = []
+
+    def send(self, chat_id, text: str):
+        self.sent.append((chat_id, text))
+        if self.echo:
+            print('===TEST=== ', text)
 
-bot = telebot.TeleBot(tg_token_salon)
-bot_tools = telebot.TeleBot(tg_token_tools)
+
+def get_signature(text: str) -> str:
+    """Similar messages differ only in numbers and links, e.g. time, product link and line numbers."""
+    return re.sub(r'\d+', '#', re.sub(r'https?://\S+', '<link>', text))
+
+
+class Notifier:
+    """
+    Non-blocking notification queue with a background sender thread.
+    Messages are coalesced by signature into one digest per digest_interval and sent within Telegram rate limits.
+    """
+
+    def __init__(self, transport, chat_id, digest_interval=DIGEST_INTERVAL, messages_per_minute=TG_MESSAGES_PER_MINUTE):
+        self.transport = transport
+        self.chat_id = chat_id
+        self.digest_interval = digest_interval
+        self.messages_per_minute = messages_per_minute
+        self.queue = queue.Queue()
+        self.sent_times = deque()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def notify(self, text: str):
+        """Queues the message and returns immediately."""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+        self.queue.put(str(text))
+
+    def close(self, timeout=30):
+        """Sends the pending messages and stops the sender thread."""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def _run(self):
+        pending = {}  # signature -> [count, first message]
+        next_flush = time.monotonic() + self.digest_interval
+        while True:
+            try:
+                text = self.queue.get(timeout=max(next_flush - time.monotonic(), 0))
+            except queue.Empty:
+                text = ''
+            if text is None:
+                self._flush(pending)
+                return
+            if text:
+                pending.setdefault(get_signature(text), [0, text])[0] += 1
+            if time.monotonic() >= next_flush:
+                self._flush(pending)
+                pending = {}
+                next_flush = time.monotonic() + self.digest_interval
+
+    def _flush(self, pending: dict):
+        digest = '\n\n'.join(text if count == 1 else f'[x{count}] {text}' for count, text in pending.values())
+        for start in range(0, len(digest), TG_MAX_MESSAGE_LENGTH):
+            self._send(digest[start:start + TG_MAX_MESSAGE_LENGTH])
+
+    def _send(self, text: str):
+        if len(self.sent_times) >= self.messages_per_minute:
+            time.sleep(max(self.sent_times.popleft() + 60 - time.monotonic(), 0))
+        self.sent_times.append(time.monotonic())
+        try:
+            self.transport.send(self.chat_id, text)
+        except Exception as e:
+            print(f'{type(e).__name__} Error sending notification: {e}')
+
+
+@cache
+def get_service_notifier() -> Notifier:
+    transport = TelebotTransport(get_bot('tg_token_tools')) if do_send_to_bot() else NullTransport()
+    return Notifier(transport, get_env('admin_tg'))
+
+
+@cache
+def get_user_sender() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=USER_SEND_THREADS, thread_name_prefix='tg_user')
+
+
+def _send_to_user(user: int, text: str):
+    try:
+        get_bot('tg_token_salon').send_message(user, text)
+    except:
+        get_bot('tg_token_tools').send_message(get_env('admin_tg'), f'Ошибка отправки сообщения пользователю {user}')
+
+
+def _send_to_admin(text: str):
+    try:
+        get_bot('tg_token_salon').send_message(get_env('admin_tg'), text)
+    except Exception as e:
+        print(f'{type(e).__name__} Error sending message to admin: {e}')
 
 
 def send_tg_message(text: str, *users: int):
+    """Queues the message to the users and its copy to the admin without blocking the caller."""
     text = text[0:TG_MAX_MESSAGE_LENGTH]
-    if DO_SEND_TO_BOT:
+    if do_send_to_bot():
         for user in users:
-            try:
-                bot.send_message(user, text)
-            except:
-                bot_tools.send_message(admin_tg, f'Ошибка отправки сообщения пользователю {user}')
-        bot.send_message(admin_tg, text)
+            get_user_sender().submit(_send_to_user, user, text)
+        get_user_sender().submit(_send_to_admin, text)
     else:
         print('===TEST=== ', text)
 
 
 def send_service_tg_message(text: str):
     text = text[0:TG_MAX_MESSAGE_LENGTH]
-    if DO_SEND_TO_BOT:
-        bot_tools.send_message(admin_tg, text)
+    if do_send_to_bot():
+        get_bot('tg_token_tools').send_message(get_env('admin_tg'), text)
+
+
+def notify_service(text: str):
+    """Queues a service message to be sent in the next digest without blocking the caller."""
+    get_service_notifier().notify(text)
@@ -1,26 +1,38 @@
 import asyncio
+import json
 import os
 import platform
 import re
+import subprocess
+import sys
+import threading
 import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
 from enum import StrEnum
 from pathlib import Path
-from typing import Optional
-from urllib.parse import quote
-import colorama
+from typing import TYPE_CHECKING, Callable, Optional
+from urllib.parse import parse_qs, quote, urlsplit
 import constants
 import xls_functions
-from bs4 import BeautifulSoup
-from httpx import AsyncClient
+from archive import PageArchive, PageNotArchived
+from concurrency import OVERLOAD_STATUS_CODES, AIMDLimiter
 from loguru import logger
-from messengers import send_service_tg_message
+from messengers import notify_service
+from pricing import PricingRules
+from proxies import Proxy, ProxyPool
+from recrawl import RecrawlHistory
+from session_state import SessionStore, cookies_from_jar, restore_cookies
+from shard import MemoryWorkQueue, open_work_queue
 from openpyxl import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
-from playwright.async_api import async_playwright
 from retry import retry
 
+if TYPE_CHECKING:  # imported on first use: bs4 and httpx by the first request, playwright only to render javascript
+    from bs4 import BeautifulSoup
+    from httpx import AsyncClient
+
 
 def set_work_dir():
     """Sets the working directory to the script's directory."""
@@ -32,6 +44,64 @@ def get_color(num: int) -> str:
     return f'\033[{31 + num % 6}m'
 
 
+TIERED_MIN_ESCALATIONS = 3  # Escalated pages of a URL pattern before it is rendered without trying httpx
+TIERED_BROWSER_SHARE = 0.9  # Share of escalated pages of a URL pattern to render it without trying httpx
+TIERED_PROBE_INTERVAL = 20  # Every N-th page of a rendered URL pattern is tried with httpx again
+SHARD_LOG_FORMAT = '{level}|{message}'  # Lines of the worker processes parsed by the coordinator, see _forward_log
+# Markers of the challenge interstitials only. Cloudflare adds its challenge-platform script to ordinary pages too
+CHALLENGE_MARKERS = ('<title>Just a moment...</title>', 'cf-browser-verification', '_cf_chl_opt')
+CHALLENGE_STATUS_CODES = {403, 503}
+
+
+def is_challenge_page(html: str, status_code: Optional[int] = None) -> bool:
+    """
+    Checks if the page is a JavaScript/Cloudflare challenge instead of the requested page. Challenges are answered
+    with 403 or 503, so pages with another status are not challenges. None - the status is unknown, e.g. in the browser.
+    """
+    if status_code is not None and status_code not in CHALLENGE_STATUS_CODES:
+        return False
+    return any(marker in html for marker in CHALLENGE_MARKERS)
+
+
+class MarkersReceived:
+    """Stop condition of a streamed page, see markers_received."""
+
+    def __init__(self, *markers: str):
+        self.markers = markers
+
+    def __call__(self, html: str) -> bool:
+        return self.scanner()(html)
+
+    def scanner(self) -> Callable[[str], bool]:
+        """Returns a function fed with the received chunks, which scans only the new chunk and a marker overlap."""
+        found = 0  # number of the markers found
+        tail = ''  # end of the previous chunks where the next marker may start
+
+        def feed(chunk: str) -> bool:
+            nonlocal found, tail
+            text = tail + chunk
+            position = 0
+            while found < len(self.markers):
+                start = text.find(self.markers[found], position)
+                if start < 0:
+                    tail = text[max(position, len(text) - len(self.markers[found]) + 1):]
+                    return False
+                position = start + len(self.markers[found])
+                found += 1
+            return True
+
+        return feed
+
+
+def markers_received(*markers: str) -> MarkersReceived:
+    """
+    Returns the stop condition of a streamed page: all the markers are received in the given order, e.g.
+    markers_received('application/ld+json', '</script>') for the end of the first JSON-LD block.
+    get_html_page scans only the new chunks for it instead of all the received text.
+    """
+    return MarkersReceived(*markers)
+
+
 class ComparisonField(StrEnum):
     SKU = 'art'
     NAME = 'name'
@@ -57,6 +127,9 @@ class Parser(ABC):
 
     # Configuration variables with descriptions
     number_of_workers = 3  # Number of concurrent asynchronous workers
+    adaptive_concurrency = False  # Adjust the number of in-flight requests by latency and errors instead
+    concurrency_floor = 1  # Minimal number of in-flight requests with adaptive_concurrency
+    concurrency_ceiling = 10  # Maximal number of in-flight requests with adaptive_concurrency
     worker_timeout = 1  # Timeout in seconds for each worker
     worker_attempts = 2  # Number of attempts to fetch a page before giving up
 
@@ -65,6 +138,7 @@ class Parser(ABC):
     output_path = constants.OUTPUT_PATH  # Path to the directory where the Excel file will be saved
     use_discount = True  # Whether to consider supplier's discount in calculations
     max_products_per_page = ''  # String to append to category URLs to maximize product output
+    pagination_window = 4  # Category pages fetched at once by get_paginated_links
 
     excluded_links = []  # List of product links to exclude from parsing
     excluded_links_parts = []  # List of URL fragments to exclude links containing them
@@ -82,6 +156,7 @@ class Parser(ABC):
     proxy_scheme: str = 'http'
     proxy_username: str = ''
     proxy_password: str = ''
+    proxies: list[Proxy] = []  # Proxy pool used instead of proxy_host, see proxies.Proxy
 
     # Column numbers for storing data in the Excel file
     art_clmn = 1
@@ -95,29 +170,116 @@ class Parser(ABC):
     discount_clmn = 9
     present_at_site_clmn = 11
     unavailable_at_site_times_clmn = 12
+    raw_price_clmn = 13  # Supplier's price before pricing_rules
+    raw_oldprice_clmn = 14  # Supplier's old price before pricing_rules
+    category_clmn = 15  # Category link the product was found in, for per-category pricing_rules
 
     # Additional configuration options
     render_javascript = False  # Enable JavaScript rendering
     headless = True  # Run the browser in headless mode. False for clouflare protection
+    browser_service = ''  # CDP endpoint of browser_service.py to use instead of launching a browser every run
+    hybrid_rendering = False  # With render_javascript, pass challenges in the browser and fetch pages with httpx
+    challenge_timeout = 30  # Seconds to wait for the browser to pass a challenge
+    tiered_rendering = False  # Fetch pages with httpx and render only the ones failing is_page_valid in the browser
+    archive_mode = ''  # 'record' or 'replay' the pages of ./archive/<price_file>.sqlite, also --record or --replay
+    replay_latency_factor = 0  # Replayed pages wait for the recorded fetch time multiplied by this. 0 - no waiting
+    soup_features = 'html.parser'  # BeautifulSoup parser backend: html.parser, lxml or html5lib
     use_connection_pool = True  # Reuse existing network connections if True, create new ones otherwise
+    persist_session = False  # Keep cookies and the browser storage between runs, encrypted with SESSION_KEY from .env
+    session_max_age = 24  # Hours after which the kept session is discarded
     use_dalayed_availability = True  # Delay marking products as unavailable until multiple checks
     compared_product_field = 'art'  # Field used as primary key to identify products (art or name)
     max_unavailable_count = 4  # Maximum number of checks before marking a product as unavailable
+    pricing_rules: Optional[PricingRules] = None  # Markup applied to raw supplier prices before saving
+    write_change_log = True  # Write new, removed, price and availability changes to <price_file>_changes.jsonl
+    write_delta_workbook = False  # Also save only the changed rows to <price_file>_delta.xlsx
+    recrawl_budget = 0  # Products most likely changed to refresh per run between full sweeps. 0 - always crawl all
+    full_sweep_interval = 24  # Hours between full sweeps finding new and removed products when recrawl_budget is set
+    shard_workers = 0  # Worker processes parsing product links from a shared queue. 0 - parse in this process
+    shard_queue = ''  # Shared queue: SQLite file or redis://host:port/db. Default ./state/<price_file>_queue.sqlite
+    shard_poll_interval = 1  # Seconds between checks of the shared queue for links and results
+
+    # Logging configuration
+    log_level = 'DEBUG'  # Level of the console and debug log. 'INFO' skips building debug messages at all
+    log_enqueue = True  # Write log files from a background thread instead of the event loop
+    log_json = False  # Also write the debug log as JSON lines to ./log/<price_file>.json
+    log_sampling = {}  # Debug message kind ('queued', 'getting', 'writing') -> log 1 of every N messages
 
     def __init__(self):
+        # Worker processes of sharded parsing only parse pages, the coordinator saves the results and writes the logs
+        self.shard_worker_mode = '--shard-worker' in sys.argv
         set_work_dir()
         self._init_loggers()
         self._setup_proxies()
         self._setup_event_loop()
-        self._init_workbook()
+        self.price_file_absolute = Path(constants.OUTPUT_PATH) / self.price_file
+        if not self.shard_worker_mode:
+            self._init_workbook()
 
         self.client = None
+        self.proxy_clients = {}  # proxy URL -> httpx client of the proxy pool
+        self.proxy_contexts = {}  # proxy URL -> Playwright context of the proxy pool
+
+        # Session of the previous run, e.g. login or clearance cookies
+        self.session_store = None
+        self.session = {}
+        if self.persist_session:
+            try:
+                self.session_store = SessionStore(f'./state/{Path(self.price_file).stem}_session.bin',
+                                                  constants.SESSION_KEY, self.session_max_age)
+            except (ValueError, ImportError) as e:  # no or invalid SESSION_KEY, or no cryptography package
+                logger.warning(f'Session of {self.site} is not kept between runs: {str(e)}')
+            else:
+                self.session = self.session_store.load()
+        self.session_restored = bool(self.session)
+
+        # Clearance cookies of the browser used by the httpx clients in hybrid_rendering
+        self.browser_cookies = (self.session.get('storage_state') or {}).get('cookies', [])
+        self.clearance_lock = asyncio.Lock()
+        self.clearance_generation = 0
+
+        # URL pattern -> pages valid with httpx, escalated to the browser and rendered without trying httpx
+        self.render_modes_file = Path(f'./state/{Path(self.price_file).stem}_render_modes.json')
+        self.render_modes = {}
+        if self.tiered_rendering and self.render_modes_file.exists():
+            self.render_modes = json.loads(self.render_modes_file.read_text(encoding='utf-8'))
         # Initialize the Playwright browser and context
         self.playwright = None
         self.browser = None
         self.context = None
 
         self.queue = asyncio.Queue()
+        self.link_categories = {}  # product link -> category link
+        self.work_queue = None  # Shared queue replacing self.queue in sharded mode
+        self.limiter = None
+        if self.adaptive_concurrency:
+            self.limiter = AIMDLimiter(self.concurrency_floor, self.concurrency_ceiling)
+
+        # Replayed runs save the results next to the price file instead of replacing it
+        if '--record' in sys.argv:
+            self.archive_mode = 'record'
+        elif '--replay' in sys.argv or '--benchmark' in sys.argv:
+            self.archive_mode = 'replay'
+        self.archive = None
+        if self.archive_mode:
+            self.archive = PageArchive(f'./archive/{Path(self.price_file).stem}.sqlite')
+        if self.archive_mode == 'replay':
+            self.price_file_absolute = self.price_file_absolute.with_stem(f'{self.price_file_absolute.stem}_replay')
+
+        # Change history for budgeted recrawls, which need the previous results kept by delayed availability
+        self.history = None
+        self.full_sweep = True
+        if (self.recrawl_budget and self.use_dalayed_availability and self.archive_mode != 'replay' and
+                not self.shard_worker_mode):
+            self.history = RecrawlHistory(f'./state/{Path(self.price_file).stem}_history.sqlite')
+            self.full_sweep = self.history.full_sweep_due(self.full_sweep_interval)
+
+    async def prepare(self) -> None:
+        """
+        Runs before the links are collected, also by recrawls and shard workers which don't collect them. Log in here
+        instead of in get_categories_links. To be overridden in subclasses.
+        """
+        pass
 
     @abstractmethod
     async def get_categories_links(self, link: str) -> list[str]:
@@ -144,33 +306,60 @@ class Parser(ABC):
     def _init_loggers(self) -> None:
         """Initializes loggers for debug and info messages."""
         name = Path(self.price_file).stem
+        self.log_counters = {}
+        logger.remove()  # the default console handler accepts DEBUG regardless of log_level
+        if self.shard_worker_mode:  # the coordinator writes the lines to its own logs
+            logger.add(sink=sys.stderr, format=SHARD_LOG_FORMAT, level=self.log_level, colorize=False)
+            return
+        logger.add(sink=sys.stderr, level=self.log_level)
         logger.add(
             sink=f'./log/{name}_debug.log',
             format='{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}',
-            level='DEBUG',
+            level=self.log_level,
             rotation='5 days',
             retention='10 days',
+            enqueue=self.log_enqueue,
         )
+        if self.log_json:
+            logger.add(
+                sink=f'./log/{name}.json',
+                level=self.log_level,
+                serialize=True,
+                rotation='5 days',
+                retention='10 days',
+                enqueue=self.log_enqueue,
+            )
         logger.add(
             sink=f'./log/{name}.log',
             format='{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}',
             level='INFO',
             backtrace=True,
             diagnose=True,
+            enqueue=self.log_enqueue,
         )
         logger.add(
-            sink=lambda msg: send_service_tg_message(msg),
+            sink=notify_service,
             format='{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}',
             level='ERROR',
             backtrace=True,
             diagnose=True,
         )
 
+    def _debug(self, kind: str, message: str, *args) -> None:
+        """
+        Logs a debug message of the given kind, only 1 of every log_sampling[kind] messages.
+        The message is formatted with args only if some sink accepts DEBUG.
+        """
+        count = self.log_counters[kind] = self.log_counters.get(kind, 0) + 1
+        if (count - 1) % self.log_sampling.get(kind, 1) == 0:
+            logger.opt(depth=1).debug(message, *args)
+
     def _init_workbook(self) -> None:
         Path(constants.OUTPUT_PATH).mkdir(parents=True, exist_ok=True)
-        self.price_file_absolute = Path(constants.OUTPUT_PATH) / self.price_file
 
-        if self.use_dalayed_availability:
+        # Without delayed availability the results of a run replace the previous ones, repricing changes them
+        self.updates_price_file = self.use_dalayed_availability or '--reprice' in sys.argv
+        if self.updates_price_file:
             self.wb: Workbook = xls_functions.init(self.price_file_absolute, create_on_error=True)
         else:
             self.wb: Workbook = Workbook()  # Create a new workbook
@@ -183,11 +372,20 @@ class Parser(ABC):
             case 'name':
                 self.compare_by_column_number = self.name_clmn
 
-        self.index = xls_functions.index_file(self.sh, self.compare_by_column_number)
+        self.table = xls_functions.PriceTable(self.sh)
+        self.previous_state = {}
+        if self.write_change_log or self.write_delta_workbook:
+            if self.updates_price_file:
+                self.previous_state = self._get_state(self.table)
+            else:  # the results are written to a new workbook, the previous ones are only in the price file
+                self.previous_state = self._get_state(xls_functions.PriceTable.from_file(self.price_file_absolute,
+                                                                                         create_on_error=True))
+        self.found_rows = set()
 
     def _setup_proxies(self):
         self.proxy_url = None
         self.playwright_proxy = None
+        self.proxy_pool = ProxyPool(self.proxies) if self.proxies else None
 
         if self.proxy_host:
             self.proxy_url = self._build_proxy_url()
@@ -202,55 +400,350 @@ class Parser(ABC):
             credentials = f'{quote(self.proxy_username, safe="")}:{quote(self.proxy_password, safe="")}@'
         return f'{self.proxy_scheme}://{credentials}{self.proxy_host}:{self.proxy_port}'
 
-    def _get_httpx_client(self) -> AsyncClient:
-        return AsyncClient(follow_redirects=True, proxy=self.proxy_url, headers=self.headers, timeout=30)
+    def _get_httpx_client(self, proxy_url: Optional[str] = None) -> 'AsyncClient':
+        from httpx import AsyncClient
+        client = AsyncClient(follow_redirects=True, proxy=proxy_url or self.proxy_url, headers=self.headers, timeout=30)
+        restore_cookies(client.cookies, self.session.get('cookies', []))
+        if self.hybrid_rendering:
+            restore_cookies(client.cookies, self.browser_cookies)
+        return client
 
     async def _init_playwright(self):
         """Initializes the Playwright library and creates a new browser context.
         for javascript rendering"""
+        from playwright.async_api import async_playwright
         self.playwright = await async_playwright().start()
+        if self.browser_service:
+            from browser_service import is_healthy  # imports urllib.request, slow to import for every run
+            if await asyncio.to_thread(is_healthy, self.browser_service):
+                # the shared browser is warm already, the site's proxy is set for its own context
+                self.browser = await self.playwright.chromium.connect_over_cdp(self.browser_service)
+                self.context = await self.browser.new_context(
+                    user_agent=self.user_agent, extra_http_headers=self.extra_http_headers,
+                    storage_state=self.session.get('storage_state'), proxy=self.playwright_proxy
+                )
+                return
+            logger.warning(f'Browser service {self.browser_service} is not available, launching a browser')
         self.browser = await self.playwright.chromium.launch(headless=self.headless, proxy=self.playwright_proxy)
         self.context = await self.browser.new_context(
-            user_agent=self.user_agent, extra_http_headers=self.extra_http_headers
+            user_agent=self.user_agent, extra_http_headers=self.extra_http_headers,
+            storage_state=self.session.get('storage_state')
         )
         page = await self.context.new_page()
         await page.goto('about:blank')
 
+    async def _get_proxy_context(self, proxy: Proxy):
+        if proxy.url not in self.proxy_contexts:
+            self.proxy_contexts[proxy.url] = await self.browser.new_context(
+                user_agent=self.user_agent, extra_http_headers=self.extra_http_headers, proxy=proxy.playwright_proxy
+            )
+        return self.proxy_contexts[proxy.url]
+
     async def _close_playwright(self):
+        for context in self.proxy_contexts.values():
+            await context.close()
         await self.context.close()
         await self.browser.close()
         await self.playwright.stop()
 
     def _setup_event_loop(self):
         """Sets up the event loop policy for Windows systems."""
-        if platform.system().lower() == 'windows' and not self.render_javascript:
+        if platform.system().lower() == 'windows' and not self.render_javascript and not self.tiered_rendering:
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-    async def get_html_page(self, url: str):
-        """Fetches the HTML content of a page asynchronously."""
+    def _request_slot(self):
+        """Waits for the adaptive concurrency limit, if enabled, before a request."""
+        return self.limiter.slot() if self.limiter else nullcontext()
+
+    def _get_workers_count(self) -> int:
+        return self.concurrency_ceiling if self.limiter else self.number_of_workers
+
+    def _write_concurrency_trace(self, suffix: str = '') -> None:
+        """Writes the adaptive concurrency limit over the run to ./log/<price_file>_concurrency.jsonl"""
+        if not self.limiter:
+            return
+        with open(f'./log/{Path(self.price_file).stem}_concurrency{suffix}.jsonl', 'w', encoding='utf-8') as f:
+            for seconds, limit in self.limiter.trace:
+                f.write(json.dumps({'seconds': seconds, 'limit': limit}) + '\n')
+        logger.info(f'Concurrency of {self.site} ended at {int(self.limiter.limit)}, '
+                    f'max {max(limit for _, limit in self.limiter.trace)}')
+
+    async def get_html_page(self, url: str, until: Optional[Callable[[str], bool]] = None, max_bytes: int = 0):
+        """
+        Fetches the HTML content of a page asynchronously.
+        With until or max_bytes the page is streamed and the connection is closed as soon as until is true for the
+        received part of the page or max_bytes are received. The received part is returned then.
+        """
+        html, _ = await self._get_html_response(url, until, max_bytes)
+        return html
+
+    async def _get_html_response(self, url: str, until: Optional[Callable[[str], bool]],
+                                 max_bytes: int) -> tuple[str, int]:
+        """Returns the HTML content and the status code of the response."""
+        async with self._request_slot():
+            if not self.proxy_pool:
+                html, _, status_code = await self._get_html_page(url, None, until, max_bytes)
+                return html, status_code
+            async with self.proxy_pool.acquire() as proxy:
+                html, size, status_code = await self._get_html_page(url, proxy.url, until, max_bytes)
+                proxy.bytes_received += size
+                return html, status_code
+
+    async def _get_html_page(self, url: str, proxy_url: Optional[str], until: Optional[Callable[[str], bool]],
+                             max_bytes: int) -> tuple[str, int, int]:
         if self.use_connection_pool:
+            if proxy_url:
+                if proxy_url not in self.proxy_clients:
+                    self.proxy_clients[proxy_url] = self._get_httpx_client(proxy_url)
+                return await self._fetch_page(self.proxy_clients[proxy_url], url, until, max_bytes)
             if self.client is None:
                 self.client = self._get_httpx_client()
-            r = await self.client.get(url=url)
+            return await self._fetch_page(self.client, url, until, max_bytes)
         else:  # new client for every request
-            async with self._get_httpx_client() as temp_client:
-                r = await temp_client.get(url=url)
-        return r.text
+            async with self._get_httpx_client(proxy_url) as temp_client:
+                return await self._fetch_page(temp_client, url, until, max_bytes)
+
+    @staticmethod
+    async def _fetch_page(client: 'AsyncClient', url: str, until: Optional[Callable[[str], bool]],
+                          max_bytes: int) -> tuple[str, int, int]:
+        """Returns the page, the number of bytes received and the status code."""
+        if not until and not max_bytes:
+            r = await client.get(url=url)
+            if r.status_code in OVERLOAD_STATUS_CODES:  # retried later instead of parsing the error page
+                r.raise_for_status()
+            return r.text, r.num_bytes_downloaded, r.status_code
+        # markers_received scans only the new chunks, other conditions are called with all the received text
+        feed = until.scanner() if isinstance(until, MarkersReceived) else None
+        async with client.stream('GET', url) as r:
+            if r.status_code in OVERLOAD_STATUS_CODES:
+                await r.aread()  # the error page is checked for a challenge by get_hybrid_page
+                r.raise_for_status()
+            chunks = []
+            async for chunk in r.aiter_text():
+                chunks.append(chunk)
+                if feed:
+                    if feed(chunk):
+                        break  # the rest of the body is not read, the connection is closed on exit
+                elif until and until(''.join(chunks)):
+                    break
+                if max_bytes and r.num_bytes_downloaded >= max_bytes:
+                    break
+            return ''.join(chunks), r.num_bytes_downloaded, r.status_code
 
     async def get_javascript_page(self, url: str) -> str:
+        if self.context is None:
+            await self._init_playwright()
+        async with self._request_slot():
+            if not self.proxy_pool:
+                html, _ = await self._get_javascript_page(self.context, url)
+                return html
+            async with self.proxy_pool.acquire() as proxy:
+                html, size = await self._get_javascript_page(await self._get_proxy_context(proxy), url)
+                proxy.bytes_received += size
+                return html
+
+    def is_page_valid(self, url: str, soup: 'BeautifulSoup') -> bool:
+        """
+        Checks that a page fetched with httpx has the needed data, e.g. the price selector. Pages failing the check
+        are rendered in the browser with tiered_rendering. To be overridden in subclasses.
+        """
+        return True
+
+    def get_url_pattern(self, url: str) -> str:
+        """
+        Groups the pages rendered the same way for tiered_rendering: the URL directory with numbers replaced and
+        the query parameter names. Override in subclasses for sites with other URL layouts.
+        """
+        parts = urlsplit(url)
+        directory = re.sub(r'\d+', '#', parts.path.rstrip('/').rsplit('/', 1)[0])
+        query = '&'.join(sorted(parse_qs(parts.query)))
+        return f'{parts.netloc}{directory}?{query}' if query else f'{parts.netloc}{directory}'
+
+    async def _get_tiered_page(self, url: str, until: Optional[Callable[[str], bool]],
+                               max_bytes: int) -> tuple[str, 'BeautifulSoup']:
+        """Fetches the page with httpx, escalating to the browser if it fails is_page_valid."""
+        from bs4 import BeautifulSoup
+        modes = self.render_modes.setdefault(self.get_url_pattern(url), {'http': 0, 'escalated': 0, 'browser': 0})
+        rendered_pattern = (modes['escalated'] >= TIERED_MIN_ESCALATIONS and
+                            modes['escalated'] >= TIERED_BROWSER_SHARE * (modes['http'] + modes['escalated']))
+        if rendered_pattern and (modes['browser'] + 1) % TIERED_PROBE_INTERVAL:
+            modes['browser'] += 1
+        else:
+            html = await self.get_html_page(url, until, max_bytes)
+            soup = BeautifulSoup(html, features=self.soup_features)
+            if self.is_page_valid(url, soup):
+                modes['http'] += 1
+                return html, soup
+            modes['escalated'] += 1
+            self._debug('escalated', 'Rendering {} in the browser', url)
+        html = await self.get_javascript_page(url)
+        return html, BeautifulSoup(html, features=self.soup_features)
+
+    def _save_render_modes(self):
+        self.render_modes_file.parent.mkdir(parents=True, exist_ok=True)
+        self.render_modes_file.write_text(json.dumps(self.render_modes, indent=1), encoding='utf-8')
+        tried = sum(modes['http'] + modes['escalated'] for modes in self.render_modes.values())
+        escalated = sum(modes['escalated'] for modes in self.render_modes.values())
+        rendered = sum(modes['browser'] for modes in self.render_modes.values())
+        logger.info(f'{escalated} of {tried} pages of {self.site} escalated to the browser '
+                    f'({escalated / (tried or 1):.0%}), {rendered} rendered without trying httpx')
+
+    async def get_hybrid_page(self, url: str, until: Optional[Callable[[str], bool]] = None, max_bytes: int = 0) -> str:
+        """
+        Fetches the page with httpx using the clearance cookies of the browser. On a challenge the page is loaded
+        in the browser instead and its new cookies are handed to httpx, one browser load at a time.
+        """
+        generation = self.clearance_generation
+        html = await self._get_html_page_unless_challenge(url, until, max_bytes)
+        if html is not None:
+            return html
+        async with self.clearance_lock:
+            if generation != self.clearance_generation:  # cookies were refreshed by another worker meanwhile
+                html = await self._get_html_page_unless_challenge(url, until, max_bytes)
+                if html is not None:
+                    return html
+            return await self._refresh_clearance(url)
+
+    async def _get_html_page_unless_challenge(self, url: str, until: Optional[Callable[[str], bool]],
+                                              max_bytes: int) -> Optional[str]:
+        try:
+            html, status_code = await self._get_html_response(url, until, max_bytes)
+        except Exception as e:  # 503 challenges are raised as overload errors
+            response = getattr(e, 'response', None)
+            if response is not None and (response.headers.get('cf-mitigated') == 'challenge' or
+                                         is_challenge_page(response.text, response.status_code)):
+                return None
+            raise
+        return None if is_challenge_page(html, status_code) else html
+
+    async def _refresh_clearance(self, url: str) -> str:
+        """Loads the page in the browser until the challenge is passed and hands the cookies to the httpx clients."""
         if self.context is None:
             await self._init_playwright()
         page = await self.context.new_page()
         try:
             await page.goto(url)
-            return await page.content()
+            for _ in range(self.challenge_timeout):
+                html = await page.content()
+                if not is_challenge_page(html):
+                    break
+                await page.wait_for_timeout(1000)
+            else:
+                raise Exception(f'Challenge at {url} was not passed in {self.challenge_timeout} sec')
+            user_agent = await page.evaluate('navigator.userAgent')
+        finally:
+            await page.close()
+
+        self.browser_cookies = await self.context.cookies()
+        self.headers = {**self.headers, 'User-Agent': user_agent}  # clearance is bound to the user agent
+        for client in [self.client, *self.proxy_clients.values()]:
+            if client is not None:
+                restore_cookies(client.cookies, self.browser_cookies)
+                client.headers['User-Agent'] = user_agent
+        self.clearance_generation += 1
+        logger.info(f'Got clearance cookies of {self.site} in the browser')
+        return html
+
+    async def _get_javascript_page(self, context, url: str) -> tuple[str, int]:
+        """Returns the rendered page and the number of bytes received for it with all its resources."""
+        finished = []
+        page = await context.new_page()
+        if self.proxy_pool:
+            page.on('requestfinished', finished.append)
+        try:
+            await page.goto(url)
+            html = await page.content()
         finally:
             await page.close()
+        size = 0
+        for request in finished:
+            sizes = await request.sizes()
+            size += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        return html, size
 
-    async def get_soup(self, url: str) -> BeautifulSoup:
-        """Fetches the HTML content and parses it into a BeautifulSoup object."""
-        html = await self.get_javascript_page(url) if self.render_javascript else await self.get_html_page(url)
-        return BeautifulSoup(html, features='html.parser')
+    async def get_soup(self, url: str, until: Optional[Callable[[str], bool]] = None,
+                       max_bytes: int = 0) -> 'BeautifulSoup':
+        """
+        Fetches the HTML content and parses it into a BeautifulSoup object.
+        until and max_bytes stop reading the page early, see get_html_page. Rendered pages are always read in full.
+        With archive_mode the page is recorded to or replayed from the archive.
+        """
+        from bs4 import BeautifulSoup
+        html, soup = await self._get_page(url, until, max_bytes)
+        return soup or BeautifulSoup(html, features=self.soup_features)
+
+    async def get_page(self, url: str, until: Optional[Callable[[str], bool]] = None, max_bytes: int = 0) -> str:
+        """Fetches the HTML content the same way as get_soup, for extractors not using BeautifulSoup."""
+        html, _ = await self._get_page(url, until, max_bytes)
+        return html
+
+    async def _get_page(self, url: str, until: Optional[Callable[[str], bool]],
+                        max_bytes: int) -> tuple[str, Optional['BeautifulSoup']]:
+        """Returns the HTML content and its BeautifulSoup object if it was parsed on the way."""
+        if self.archive_mode == 'replay':
+            return await self._replay_page(url), None
+        start = time.monotonic()
+        soup = None
+        if self.tiered_rendering:
+            html, soup = await self._get_tiered_page(url, until, max_bytes)
+        elif self.render_javascript and self.hybrid_rendering:
+            html = await self.get_hybrid_page(url, until, max_bytes)
+        elif self.render_javascript:
+            html = await self.get_javascript_page(url)
+        else:
+            html = await self.get_html_page(url, until, max_bytes)
+        if self.archive_mode == 'record':
+            self.archive.record(url, html, time.monotonic() - start)
+        return html, soup
+
+    async def _replay_page(self, url: str) -> str:
+        if (page := self.archive.get(url)) is None:
+            raise PageNotArchived(f'Page {url} is not in the archive')
+        html, latency = page
+        if self.replay_latency_factor:
+            await asyncio.sleep(latency * self.replay_latency_factor)
+        return html
+
+    async def get_paginated_links(self, page_url: str | Callable[[int], str],
+                                  parse_page: Callable[['BeautifulSoup'], list[str]], pages: Optional[int] = None,
+                                  is_last_page: Optional[Callable[['BeautifulSoup'], bool]] = None,
+                                  first_page: Optional['BeautifulSoup'] = None, as_html: bool = False) -> list[str]:
+        """
+        Collects the product links from the pages of a category, pagination_window pages at once.
+
+        :param page_url: Template with {page} or a function returning the URL of the page number, starting with 1.
+        :param parse_page: Returns the product links on the page.
+        :param pages: Number of pages if known. Otherwise windows of pages are fetched ahead and the pages after
+            the one for which is_last_page is true or which has no links are discarded.
+        :param first_page: Page 1 if it was already fetched, e.g. to read the number of pages.
+        :param as_html: Pass the HTML content of the pages to parse_page and is_last_page instead of BeautifulSoup.
+        """
+        semaphore = asyncio.Semaphore(self.pagination_window)
+
+        async def get_page(page: int) -> 'BeautifulSoup':
+            if page == 1 and first_page is not None:
+                return first_page
+            async with semaphore:
+                url = page_url.format(page=page) if isinstance(page_url, str) else page_url(page)
+                return await (self.get_page(url) if as_html else self.get_soup(url))
+
+        if pages is not None:
+            soups = await asyncio.gather(*(get_page(page) for page in range(1, pages + 1)))
+            return [link for soup in soups for link in parse_page(soup)]
+
+        links = []
+        page = 1
+        while True:
+            window = range(page, page + self.pagination_window)
+            soups = await asyncio.gather(*(get_page(page) for page in window), return_exceptions=True)
+            for soup in soups:  # errors of the pages after the last one do not matter
+                if isinstance(soup, Exception):
+                    raise soup
+                page_links = parse_page(soup)
+                links.extend(page_links)
+                if not page_links or (is_last_page and is_last_page(soup)):
+                    return links
+            page = window.stop
 
     async def _get_links_for_processing(self, site: str):
         """
@@ -263,10 +756,30 @@ class Parser(ABC):
             for link in product_links:
                 if link not in unique_links and self._is_valid_link(link):
                     unique_links.add(link)
-                    await self.queue.put(link)
-                    logger.debug(f'Appended link to queue: {link}')
+                    await self._enqueue(link, category_link)
+                    self._debug('queued', 'Appended link to queue: {}', link)
         return len(unique_links)
 
+    async def _get_recrawl_links(self):
+        """Adds the links most likely to have changed to the queue instead of crawling all the categories."""
+        links = self.history.select(self.recrawl_budget)
+        for link, category_link in links:
+            await self._enqueue(link, category_link)
+        logger.info(f'Recrawling {len(links)} of the products most likely changed at {self.site}')
+        return len(links)
+
+    async def _enqueue(self, link: str, category_link: Optional[str]):
+        self.link_categories[link] = category_link
+        if self.work_queue:
+            await asyncio.to_thread(self.work_queue.put, link, category_link)
+        else:
+            await self.queue.put(link)
+
+    def _record_history(self, product_link: str, products: list[Product]):
+        state = sorted((str(product.art), str(product.name), product.price, product.old_price or 0,
+                        product.available) for product in products)
+        self.history.record(product_link, repr(state), self.link_categories.get(product_link))
+
     def _is_valid_link(self, link: str) -> bool:
         """Checks if the given link should be excluded based on configured URL fragments."""
         return link not in self.excluded_links and not any(part in link for part in self.excluded_links_parts)
@@ -283,43 +796,62 @@ class Parser(ABC):
 
     def _write_product(self, product: Product):
         """Writes a product to the Excel sheet, determining the correct row based on the comparison field."""
-        key = getattr(product, self.compared_product_field).lower().strip()
-        row = self.index.get(key) or max(self.sh.max_row + 1, 2)
+        key = getattr(product, self.compared_product_field)
+        row = self.table.find_row(key, self.compare_by_column_number) or self.table.append_row()
+        self.found_rows.add(row)
         self._write_product_to_xls(row=row, product=product)
 
     def _write_product_to_xls(self, row: int, product: Product):
-        """Writes product information to the specified row in the Excel sheet."""
-        self.sh.cell(row, self.name_clmn).value = product.name
-        self.sh.cell(row, self.art_clmn).value = product.art
-        self.sh.cell(row, self.price_clmn).value = product.old_price if product.old_price else product.price
-        self.sh.cell(row, self.available_clmn).value = product.available
-        self.sh.cell(row, self.link_clmn).value = product.link
-        self.sh.cell(row, self.variant_clmn).value = product.variant
-        if self.use_discount and product.old_price:
-            self.sh.cell(row, self.discount_clmn).value = product.old_price - product.price
+        """Writes product information to the specified row of the price table."""
+        self.table.set(row, self.name_clmn, product.name)
+        self.table.set(row, self.art_clmn, product.art)
+        self.table.set(row, self.available_clmn, product.available)
+        self.table.set(row, self.link_clmn, product.link)
+        self.table.set(row, self.variant_clmn, product.variant)
+        if self.pricing_rules:  # prices are calculated from the raw ones in _apply_pricing
+            self.table.set(row, self.raw_price_clmn, product.price)
+            self.table.set(row, self.raw_oldprice_clmn, product.old_price)
+            self.table.set(row, self.category_clmn, self.link_categories.get(product.link))
         else:
-            self.sh.cell(row, self.discount_clmn).value = 0
+            self._write_prices(row, product.price, product.old_price)
 
         if self.use_dalayed_availability:
-            self.sh.cell(row, self.present_at_site_clmn).value = 'present_at_site'
+            self.table.set(row, self.present_at_site_clmn, 'present_at_site')
+
+    def _write_prices(self, row: int, price: int, old_price: Optional[int]):
+        self.table.set(row, self.price_clmn, old_price if old_price else price)
+        if self.use_discount and old_price:
+            self.table.set(row, self.discount_clmn, old_price - price)
+        else:
+            self.table.set(row, self.discount_clmn, 0)
 
-    def _process_unavailable(self):
+    def _apply_pricing(self):
+        """Calculates the prices of all the products with raw prices in one batch using pricing_rules."""
+        rows = [row for row in self.table.rows() if self.table.get(row, self.raw_price_clmn) is not None]
+        categories = [self.table.get(row, self.category_clmn) for row in rows]
+        prices = self.pricing_rules.apply([self.table.get(row, self.raw_price_clmn) for row in rows], categories)
+        old_prices = self.pricing_rules.apply([self.table.get(row, self.raw_oldprice_clmn) for row in rows],
+                                              categories)
+        for row, price, old_price in zip(rows, prices, old_prices):
+            self._write_prices(row, price, old_price)
+
+    def _process_unavailable(self, only_found: bool = False):
         """
         Handles delayed availability logic, incrementing unavailable counts and marking products as unavailable after
-        exceeding the threshold.
-        """
-        for i in range(2, self.sh.max_row + 1):
-            if not self.sh.cell(i, self.present_at_site_clmn).value:
-                if not self.sh.cell(i, self.unavailable_at_site_times_clmn).value:
-                    self.sh.cell(i, self.unavailable_at_site_times_clmn).value = 1
-                else:
-                    self.sh.cell(i, self.unavailable_at_site_times_clmn).value += 1
-                if self.sh.cell(i, self.unavailable_at_site_times_clmn).value >= self.max_unavailable_count:
-                    self.sh.cell(i, self.available_clmn).value = '-'
-                    self.sh.cell(i, self.unavailable_at_site_times_clmn).value = self.max_unavailable_count
+        exceeding the threshold. After a budgeted recrawl only the found products are processed.
+        """
+        for i in self.table.rows():
+            if only_found and i not in self.found_rows:
+                continue
+            if not self.table.get(i, self.present_at_site_clmn):
+                unavailable_times = (self.table.get(i, self.unavailable_at_site_times_clmn) or 0) + 1
+                if unavailable_times >= self.max_unavailable_count:
+                    self.table.set(i, self.available_clmn, '-')
+                    unavailable_times = self.max_unavailable_count
+                self.table.set(i, self.unavailable_at_site_times_clmn, unavailable_times)
             else:
-                self.sh.cell(i, self.unavailable_at_site_times_clmn).value = None
-                self.sh.cell(i, self.present_at_site_clmn).value = None
+                self.table.set(i, self.unavailable_at_site_times_clmn, None)
+                self.table.set(i, self.present_at_site_clmn, None)
 
     @retry(max_tries=worker_attempts)
     async def get_product_info_advanced(self, product_link: str) -> list[Product]:
@@ -335,55 +867,320 @@ class Parser(ABC):
         while True:
             product_link = await self.queue.get()
             try:
-                logger.debug(color + f'Worker {worker_id}, ---- Getting {product_link}\n')
+                self._debug('getting', color + 'Worker {}, ---- Getting {}\n', worker_id, product_link)
                 products = await self.get_product_info_advanced(product_link)
                 if not products:
-                    logger.debug(f'***********  NO PRODUCTS FOUND ON THE PAGE  *********** {product_link}')
+                    logger.debug('***********  NO PRODUCTS FOUND ON THE PAGE  *********** {}', product_link)
             except Exception as e:
                 logger.error(f'ERROR {str(e)} parsing product {product_link} for {self.worker_attempts} attempts')
             else:
-                for product in products:
-                    logger.debug(color + f'Worker {worker_id} ---- Writing {product}\n')
-                    self._write_product(product)
+                self._write_products(product_link, products, worker_id)
 
             self.queue.task_done()
             await asyncio.sleep(self.worker_timeout)
 
+    def _write_products(self, product_link: str, products: list[Product], worker_id: int):
+        color = get_color(worker_id)
+        for product in products:
+            self._debug('writing', color + 'Worker {} ---- Writing {}\n', worker_id, product)
+            self._write_product(product)
+        if self.history:
+            self._record_history(product_link, products)
+
+    async def shard_worker(self, worker_id: int):
+        """
+        Worker function of a worker process that parses product links from the shared queue and puts back the
+        products for the coordinator. Stops when the coordinator has merged all the results.
+        """
+        color = get_color(worker_id)
+        logger.info(f'Shard worker {os.getpid()}-{worker_id} - Starting parsing links of {self.site}')
+        while True:
+            task = await asyncio.to_thread(self.work_queue.take)
+            if task is None:
+                if (await asyncio.to_thread(self.work_queue.is_closed) and
+                        not await asyncio.to_thread(self.work_queue.unfinished)):
+                    return
+                await asyncio.sleep(self.shard_poll_interval)
+                continue
+            product_link, _ = task
+            try:
+                self._debug('getting', color + 'Worker {}, ---- Getting {}\n', worker_id, product_link)
+                products = await self.get_product_info_advanced(product_link)
+                if not products:
+                    logger.debug('***********  NO PRODUCTS FOUND ON THE PAGE  *********** {}', product_link)
+            except Exception as e:
+                logger.error(f'ERROR {str(e)} parsing product {product_link} for {self.worker_attempts} attempts')
+                await asyncio.to_thread(self.work_queue.done, product_link, None)
+            else:
+                await asyncio.to_thread(self.work_queue.done, product_link, [asdict(product) for product in products])
+            await asyncio.sleep(self.worker_timeout)
+
+    async def _merge_shard_results(self):
+        for product_link, products in await asyncio.to_thread(self.work_queue.take_results):
+            if products is not None:  # the error is logged by the worker
+                self._write_products(product_link, [Product(**product) for product in products], 0)
+
+    async def _coordinate(self, get_products_links_task: asyncio.Task) -> int:
+        """
+        Starts the worker processes, merges their results while the links are being found and until all of them
+        are parsed. Workers on other nodes are started with: python <site script> --shard-worker <shard_queue>
+        """
+        processes, local_tasks = [], []
+        if isinstance(self.work_queue, MemoryWorkQueue):  # the in-process stand-in is parsed by own workers
+            local_tasks = [asyncio.create_task(self.shard_worker(i)) for i in range(self._get_workers_count())]
+        else:
+            processes = [subprocess.Popen([sys.executable, *sys.argv, '--shard-worker', self.shard_queue_url],
+                                          stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+                         for _ in range(self.shard_workers)]
+            for process in processes:
+                threading.Thread(target=self._forward_log, args=(process,), daemon=True).start()
+        try:
+            while not get_products_links_task.done():
+                await asyncio.wait({get_products_links_task}, timeout=self.shard_poll_interval)
+                await self._merge_shard_results()
+            links_count = get_products_links_task.result()
+            if not links_count:
+                return 0
+            await asyncio.to_thread(self.work_queue.close)
+            logger.info(f'Found {links_count} links, waiting for the shard workers of {self.site}')
+            while unfinished := await asyncio.to_thread(self.work_queue.unfinished):
+                if processes and all(process.poll() is not None for process in processes):
+                    raise Exception(f'All shard workers exited with {unfinished} links unfinished')
+                await asyncio.sleep(self.shard_poll_interval)
+                await self._merge_shard_results()
+            await asyncio.gather(*local_tasks)
+            for process in processes:
+                process.wait()
+            return links_count
+        finally:
+            for task in local_tasks:
+                task.cancel()
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+
+    @staticmethod
+    def _forward_log(process: subprocess.Popen) -> None:
+        """Writes the log lines of a worker process to the coordinator's logs with their levels."""
+        level = 'INFO'
+        for line in process.stderr:
+            line = line.rstrip('\n')
+            name, separator, message = line.partition('|')
+            try:
+                if not separator:
+                    raise ValueError
+                logger.level(name)
+                level = name
+            except ValueError:  # continuation of a multiline message, e.g. a traceback
+                message = line
+            if message:
+                logger.log(level, 'Shard worker {}: {}', process.pid, message)
+
+    async def shard_worker_main(self):
+        """Main asynchronous function of a worker process."""
+        await self.prepare()
+        await asyncio.gather(*(self.shard_worker(i) for i in range(self._get_workers_count())))
+        await self._close_clients()
+        self._write_concurrency_trace(f'_{os.getpid()}')
+
+    async def _save_session(self):
+        """Saves the cookies of the main client and the browser storage for the next run."""
+        if self.client is not None:
+            self.session['cookies'] = cookies_from_jar(self.client.cookies.jar)
+        if self.context is not None:
+            self.session['storage_state'] = await self.context.storage_state()
+        self.session_store.save(self.session.get('cookies', []), self.session.get('storage_state'))
+
+    def invalidate_session(self):
+        """Forgets the kept session when the site reports it expired, e.g. before logging in again."""
+        self.session = {}
+        self.session_restored = False
+        if self.session_store:
+            self.session_store.clear()
+
+    async def _close_clients(self):
+        if self.session_store:
+            await self._save_session()
+        if self.tiered_rendering:
+            self._save_render_modes()
+        if self.context is not None:
+            await self._close_playwright()
+        if self.use_connection_pool:
+            for client in [self.client, *self.proxy_clients.values()]:
+                if client is not None:
+                    await client.aclose()
+        if self.proxy_pool:
+            for line in self.proxy_pool.stats():
+                logger.info(f'Proxy {line}')
+
     async def main(self):
         """
         Main asynchronous function that manages the parsing process, creates workers, and handles the queue.
+        In sharded mode the links are parsed by the worker processes instead.
         """
-        get_products_links_task = asyncio.create_task(self._get_links_for_processing(site=self.site))
-        workers_tasks = [asyncio.create_task(self.worker(i)) for i in range(self.number_of_workers)]
+        await self.prepare()
+        if self.full_sweep:
+            get_products_links_task = asyncio.create_task(self._get_links_for_processing(site=self.site))
+        else:
+            get_products_links_task = asyncio.create_task(self._get_recrawl_links())
 
-        if not await get_products_links_task:
+        if self.work_queue:
+            links_count = await self._coordinate(get_products_links_task)
+        else:
+            workers_tasks = [asyncio.create_task(self.worker(i)) for i in range(self._get_workers_count())]
+            links_count = await get_products_links_task
+            if links_count:
+                await self.queue.join()
             for task in workers_tasks:
                 task.cancel()
+        if not links_count:
             raise Exception(f'Error parcing {self.site} Unable to get any product links')
-        else:
-            await self.queue.join()
 
-        if self.render_javascript:
-            await self._close_playwright()
-        elif self.use_connection_pool:
-            await self.client.aclose()
+        await self._close_clients()
+        self._write_concurrency_trace()
+
+    def _get_state(self, table: xls_functions.PriceTable) -> dict:
+        """Returns the price, availability, unavailable count and row of every product by its comparison key."""
+        return {
+            key: (table.get(rows[0], self.price_clmn),
+                  table.get(rows[0], self.available_clmn),
+                  table.get(rows[0], self.unavailable_at_site_times_clmn),
+                  rows[0])
+            for key, rows in table.index(self.compare_by_column_number).items()
+        }
+
+    def _get_changes(self, parsed: bool = True) -> list[dict]:
+        """
+        Compares the products with the state of the price file before parsing. Removed products are known only after
+        parsing. Rows are the rows of the saved workbook, None for the products removed from it.
+        """
+        changes = []
+        state = self._get_state(self.table)
+        for key, (price, available, _, row) in state.items():
+            if (previous := self.previous_state.get(key)) is None:
+                changes.append({'change': 'new', 'key': key, 'row': row, 'price': price, 'available': available})
+                continue
+            previous_price, previous_available, _, _ = previous
+            if price != previous_price:
+                changes.append({'change': 'price', 'key': key, 'row': row, 'old': previous_price, 'new': price})
+            if available != previous_available:
+                changes.append({'change': 'available', 'key': key, 'row': row,
+                                'old': previous_available, 'new': available})
+        for key, (_, _, unavailable_times, _) in self.previous_state.items() if parsed else ():
+            row = state[key][3] if key in state else None  # without delayed availability removed rows are not kept
+            if row not in self.found_rows and not unavailable_times:  # was found by the previous run
+                changes.append({'change': 'removed', 'key': key, 'row': row})
+        return changes
+
+    def _write_changes(self, changes: list[dict]) -> None:
+        """Writes the change log and the workbook with changed rows only."""
+        stem = self.price_file_absolute.stem
+        if self.write_change_log:
+            with open(self.price_file_absolute.with_name(f'{stem}_changes.jsonl'), 'w', encoding='utf-8') as f:
+                for change in changes:
+                    f.write(json.dumps(change, ensure_ascii=False, default=str) + '\n')
+        if self.write_delta_workbook:
+            wb = Workbook(write_only=True)
+            sh = wb.create_sheet(self.sh.title)
+            sh.append(next(self.sh.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+            for row in sorted({change['row'] for change in changes} - {None}):
+                sh.append([self.table.get(row, column) for column in range(1, len(self.table.columns) + 1)])
+            wb.save(self.price_file_absolute.with_name(f'{stem}_delta.xlsx'))
+        logger.info(f'{len(changes)} changes in {self.price_file}')
+
+    def _save(self, parsed: bool = True) -> None:
+        if self.pricing_rules:
+            self._apply_pricing()
+        if self.write_change_log or self.write_delta_workbook:
+            self._write_changes(self._get_changes(parsed))
+        self.table.write_to(self.sh)
+        self.wb.save(self.price_file_absolute)
+
+    def reprice(self) -> None:
+        """
+        Re-applies pricing_rules to the raw prices saved by the last run and saves the Excel file without parsing.
+        """
+        self._save(parsed=False)
+        logger.info(f'Repriced {self.price_file_absolute}')
 
     def parse(self) -> None:
         """
         Starts the parsing process, measures execution time, and saves the results to the Excel file.
+        Run the site script with --reprice to only re-apply pricing_rules to the last results.
         """
+        if '--reprice' in sys.argv:
+            self.reprice()
+            return
+        if '--shard-worker' in sys.argv:
+            self.parse_shard()
+            return
+        if '--benchmark' in sys.argv:
+            self.benchmark()
+            return
+        started = time.time()
         try:
+            import colorama
             colorama.init()
             logger.info(f'Starting getting links for parsing for {self.site}')
             t0 = time.time()
+            if self.shard_workers or self.shard_queue:
+                self.work_queue = open_work_queue(self.shard_queue_url, Path(self.price_file).stem)
+                self.work_queue.reset()
             asyncio.run(self.main())
             t1 = time.time()
             logger.info(f'End parsing links of {self.site} Parsing Time = {t1 - t0:.02f} sec')
 
             if self.use_dalayed_availability:
-                self._process_unavailable()
+                self._process_unavailable(only_found=not self.full_sweep)
 
-            self.wb.save(self.price_file_absolute)
+            self._save(parsed=self.full_sweep)
+            if self.history and self.full_sweep:
+                self.history.finish_sweep(started)
 
         except Exception as e:
             logger.error(f'Error parsing {self.site} {str(e)}')
+        finally:
+            if self.history:
+                self.history.close()
+            if self.work_queue:
+                self.work_queue.disconnect()
+            if self.archive:
+                self.archive.close()
+
+    def benchmark(self) -> None:
+        """
+        Benchmarks the extractors on the recorded pages with the given parser backends and exits with an error on
+        a regression: python <site script> --benchmark [html.parser,lxml]
+        """
+        from benchmark import BENCHMARK_FEATURES, run_benchmark
+        position = sys.argv.index('--benchmark') + 1
+        features = BENCHMARK_FEATURES
+        if position < len(sys.argv) and not sys.argv[position].startswith('--'):
+            features = sys.argv[position].split(',')
+        try:
+            passed = asyncio.run(run_benchmark(self, features))
+        finally:
+            self.archive.close()
+        if not passed:
+            sys.exit(1)
+
+    @property
+    def shard_queue_url(self) -> str:
+        return self.shard_queue or f'./state/{Path(self.price_file).stem}_queue.sqlite'
+
+    def parse_shard(self) -> None:
+        """
+        Runs a worker process of sharded parsing: python <site script> --shard-worker [<queue URL>]
+        The results are saved by the coordinator.
+        """
+        position = sys.argv.index('--shard-worker') + 1
+        url = sys.argv[position] if position < len(sys.argv) else self.shard_queue_url
+        self.work_queue = open_work_queue(url, Path(self.price_file).stem)
+        try:
+            asyncio.run(self.shard_worker_main())
+        except Exception as e:
+            logger.error(f'Error in shard worker of {self.site} {str(e)}')
+        finally:
+            self.work_queue.disconnect()
+            if self.archive:
+                self.archive.close()
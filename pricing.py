@@ -0,0 +1,54 @@
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+
+ROUNDING = {
+    'round': round,  # Python rounding, half to even
+    'floor': math.floor,
+    'ceil': math.ceil,
+}
+
+
+@dataclass(frozen=True)
+class PriceRule:
+    """Markup of a raw supplier price: (price + offset) * multiplier, rounded, and not less than floor."""
+
+    multiplier: float = 1
+    offset: float = 0
+    rounding: str = 'round'  # One of ROUNDING
+    floor: Optional[int] = None  # Minimal resulting price
+
+    def apply(self, prices: list) -> list:
+        """Applies the rule to a batch of raw prices. Empty prices stay None."""
+        to_int = ROUNDING[self.rounding]
+        result = [None if price is None else to_int((price + self.offset) * self.multiplier) for price in prices]
+        if self.floor is not None:
+            result = [None if price is None else max(price, self.floor) for price in result]
+        return result
+
+
+@dataclass(frozen=True)
+class PricingRules:
+    """Pricing rules of a site: the default rule and overrides for categories whose link contains a URL fragment."""
+
+    default: PriceRule = PriceRule()
+    categories: dict[str, PriceRule] = field(default_factory=dict)  # URL fragment -> rule
+
+    def rule_for(self, category: Optional[str]) -> PriceRule:
+        if category:
+            for part, rule in self.categories.items():
+                if part in category:
+                    return rule
+        return self.default
+
+    def apply(self, prices: list, categories: list) -> list:
+        """Applies the rules to a batch of raw prices, one batch per distinct rule."""
+        batches: dict[PriceRule, list[int]] = {}
+        for i, category in enumerate(categories):
+            batches.setdefault(self.rule_for(category), []).append(i)
+
+        result = [None] * len(prices)
+        for rule, positions in batches.items():
+            for i, price in zip(positions, rule.apply([prices[i] for i in positions])):
+                result[i] = price
+        return result
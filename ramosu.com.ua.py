@@ -34,9 +34,8 @@ class Site(Parser):
                 podcat_links_arr.append(link['href'])
         return podcat_links_arr
 
-    async def get_products_links_per_page(self, page_link: str) -> list[str]:
+    def parse_products_links(self, soup) -> list[str]:
         products_links = []
-        soup = await self.get_soup(page_link)
         if soup.find('p', class_='empty-title'):
             return []
         for tag_item in soup.select_one("div.row.products-content").find_all("span", {"class": "h4-replace"}):
@@ -44,7 +43,6 @@ class Site(Parser):
         return products_links
 
     async def get_products_links(self, category_link: str) -> list[str]:
-        products_links = []
         soup = await self.get_soup(category_link + self.max_products_per_page)
         pagination = soup.find("ul", {"class": "pagination"})
         total_pages = 1
@@ -53,11 +51,9 @@ class Site(Parser):
             for page in reversed(pages):
                 total_pages = int(page.a.string)
                 break
-        for i in range(1, total_pages + 1):
-            next_page = f'{category_link}{"" if i == 1 else "page-" + str(i)}{self.max_products_per_page}'
-            products_links.extend(await self.get_products_links_per_page(next_page))
-
-        return products_links
+        return await self.get_paginated_links(
+            lambda i: f'{category_link}{"" if i == 1 else "page-" + str(i)}{self.max_products_per_page}',
+            self.parse_products_links, pages=total_pages, first_page=soup)
 
     async def get_product_info(self, product_link: str) -> list[Product]:
         soup = await self.get_soup(product_link)
@@ -0,0 +1,88 @@
+"""
+Adaptive recrawl: per-link change history used to spend a fixed request budget on the links most likely to have
+changed, with periodic full sweeps to find new and removed products.
+
+Run as a scheduler daemon: python recrawl.py <interval_minutes> <site script> [<site script> ...]
+"""
+import math
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PRIOR_CHANGES = 1  # Every link is assumed to change once per PRIOR_SECONDS until observed otherwise
+PRIOR_SECONDS = 7 * 24 * 3600
+
+
+def change_probability(changes: int, observed_seconds: float, age_seconds: float) -> float:
+    """
+    Probability that a link changed since it was last checked, with changes modelled as a Poisson process
+    whose rate is estimated from the observed number of changes.
+    """
+    rate = (changes + PRIOR_CHANGES) / (observed_seconds + PRIOR_SECONDS)
+    return 1 - math.exp(-rate * age_seconds)
+
+
+class RecrawlHistory:
+    """Per-link change history of a site stored in SQLite."""
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS links (link TEXT PRIMARY KEY, category TEXT, state TEXT, '
+                        'first_checked REAL, last_checked REAL, changes INTEGER, swept REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)')
+
+    def record(self, link: str, state: str, category: str | None = None, now: float | None = None) -> bool:
+        """
+        Records the state of the products on a link page, e.g. their prices and availability.
+
+        :return: True if the state changed since the last check.
+        """
+        now = now or time.time()
+        row = self.db.execute('SELECT state FROM links WHERE link = ?', (link,)).fetchone()
+        if row is None:
+            self.db.execute('INSERT INTO links VALUES (?, ?, ?, ?, ?, 0, ?)', (link, category, state, now, now, now))
+            return False
+        changed = row[0] != state
+        self.db.execute('UPDATE links SET category = COALESCE(?, category), state = ?, last_checked = ?, '
+                        'changes = changes + ?, swept = ? WHERE link = ?',
+                        (category, state, now, int(changed), now, link))
+        return changed
+
+    def select(self, budget: int, now: float | None = None) -> list[tuple[str, str | None]]:
+        """Returns (link, category) of the budget links most likely to have changed."""
+        now = now or time.time()
+        rows = self.db.execute('SELECT link, category, changes, first_checked, last_checked FROM links').fetchall()
+        rows.sort(key=lambda row: change_probability(row[2], row[4] - row[3], now - row[4]), reverse=True)
+        return [(link, category) for link, category, *_ in rows[:budget]]
+
+    def full_sweep_due(self, interval_hours: float, now: float | None = None) -> bool:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'last_full_sweep'").fetchone()
+        return row is None or (now or time.time()) - row[0] >= interval_hours * 3600
+
+    def finish_sweep(self, started: float):
+        """Forgets the links not found by the full sweep started at the given time."""
+        self.db.execute('DELETE FROM links WHERE swept < ?', (started,))
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('last_full_sweep', ?)", (started,))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def main():
+    """Runs the site scripts one after another every interval. Each run decides itself between a budgeted
+    recrawl and a full sweep, see Parser.recrawl_budget."""
+    interval = float(sys.argv[1]) * 60
+    scripts = sys.argv[2:]
+    while True:
+        started = time.time()
+        for script in scripts:
+            subprocess.run([sys.executable, script], cwd=Path(__file__).resolve().parent)
+        time.sleep(max(started + interval - time.time(), 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Session state of a site kept between runs: httpx cookies and the Playwright storage state, encrypted at rest with
+the SESSION_KEY environment variable. Generate a key with: python session_state.py
+"""
+import json
+import time
+from http.cookiejar import CookieJar
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+
+def cookies_from_jar(jar: CookieJar) -> list[dict]:
+    return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+             'expires': cookie.expires} for cookie in jar]
+
+
+def restore_cookies(cookies, saved: list[dict]) -> None:
+    """Sets the saved cookies to httpx Cookies."""
+    for cookie in saved:
+        cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+
+def is_expired(cookie: dict, now: float) -> bool:
+    """Session cookies (without expiry, -1 in Playwright) live as long as the saved session."""
+    expires = cookie.get('expires')
+    return expires is not None and expires != -1 and expires < now
+
+
+class SessionStore:
+    """Encrypted file with the session state of a site, discarded after max_age_hours."""
+
+    def __init__(self, path: str | Path, key: str, max_age_hours: float):
+        from cryptography.fernet import Fernet
+        self.path = Path(path)
+        self.fernet = Fernet(key)
+        self.max_age_hours = max_age_hours
+
+    def load(self) -> dict:
+        """Returns the saved cookies and storage_state without the expired cookies, {} if there is no valid session."""
+        from cryptography.fernet import InvalidToken
+        if not self.path.exists():
+            return {}
+        try:
+            state = json.loads(self.fernet.decrypt(self.path.read_bytes(), ttl=int(self.max_age_hours * 3600)))
+        except InvalidToken:  # expired or encrypted with another key
+            logger.info(f'Session state {self.path} is expired or unreadable, starting a new session')
+            self.clear()
+            return {}
+        now = time.time()
+        state['cookies'] = [cookie for cookie in state.get('cookies', []) if not is_expired(cookie, now)]
+        if state.get('storage_state'):
+            state['storage_state']['cookies'] = [cookie for cookie in state['storage_state'].get('cookies', [])
+                                                 if not is_expired(cookie, now)]
+        return state
+
+    def save(self, cookies: list[dict], storage_state: Optional[dict]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        state = {'cookies': cookies, 'storage_state': storage_state}
+        self.path.write_bytes(self.fernet.encrypt(json.dumps(state).encode()))
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    from cryptography.fernet import Fernet
+    print(Fernet.generate_key().decode())
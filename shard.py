@@ -0,0 +1,214 @@
+"""
+Shared work queue for sharded crawling: the coordinator puts the product links found in the categories, worker
+processes on this machine or on other nodes take them and put back the parsed products, which the coordinator
+merges into its price file.
+
+Queue URL: a SQLite file for workers on this machine, redis://host:port/db for workers on other nodes,
+memory:// for the in-process stand-in used in tests.
+The queues can be called from several threads, e.g. with asyncio.to_thread, since the SQLite and Redis calls block.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+LEASE_TIMEOUT = 600  # Seconds after which a link taken by a dead worker is given to another worker
+
+
+class MemoryWorkQueue:
+    """In-process stand-in for the shared queues, for tests and the coordinator's own workers."""
+
+    def __init__(self):
+        self.links = deque()
+        self.results = deque()
+        self.unmerged = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.__init__()
+
+    def put(self, link: str, category: Optional[str] = None):
+        with self.lock:
+            self.links.append((link, category))
+            self.unmerged += 1
+
+    def take(self) -> Optional[tuple[str, Optional[str]]]:
+        """Returns the next (link, category) to parse or None if there are none now."""
+        try:
+            return self.links.popleft()
+        except IndexError:
+            return None
+
+    def done(self, link: str, products: Optional[list[dict]]):
+        """Puts back the products parsed from the link, None if parsing failed."""
+        with self.lock:
+            self.results.append((link, products))
+
+    def take_results(self) -> list[tuple[str, Optional[list[dict]]]]:
+        with self.lock:
+            results = list(self.results)
+            self.results.clear()
+            self.unmerged -= len(results)
+        return results
+
+    def close(self):
+        """Marks that no more links will be put, workers stop when all of them are merged."""
+        self.closed = True
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    def unfinished(self) -> int:
+        """Number of links whose results are not merged yet."""
+        return self.unmerged
+
+    def disconnect(self):
+        pass
+
+
+class SQLiteWorkQueue:
+    """Queue in a SQLite file shared by the processes on one machine."""
+
+    def __init__(self, path: str | Path, lease_timeout: float = LEASE_TIMEOUT):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lease_timeout = lease_timeout
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()  # the transactions of the threads sharing the connection must not interleave
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, link TEXT UNIQUE, category TEXT, '
+                        'state TEXT, taken REAL, result TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def reset(self):
+        with self.lock:
+            self.db.execute('DELETE FROM tasks')
+            self.db.execute('DELETE FROM meta')
+
+    def put(self, link: str, category: Optional[str] = None):
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO tasks (link, category, state) VALUES (?, ?, 'queued')",
+                            (link, category))
+
+    def take(self) -> Optional[tuple[str, Optional[str]]]:
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')  # one worker at a time takes a link
+            try:
+                row = self.db.execute("SELECT id, link, category FROM tasks WHERE state = 'queued' "
+                                      "OR state = 'taken' AND taken < ? ORDER BY id LIMIT 1",
+                                      (now - self.lease_timeout,)).fetchone()
+                if row:
+                    self.db.execute("UPDATE tasks SET state = 'taken', taken = ? WHERE id = ?", (now, row[0]))
+            finally:
+                self.db.execute('COMMIT')
+        return row and (row[1], row[2])
+
+    def done(self, link: str, products: Optional[list[dict]]):
+        with self.lock:
+            self.db.execute("UPDATE tasks SET state = 'done', result = ? WHERE link = ? AND state = 'taken'",
+                            (json.dumps(products, ensure_ascii=False), link))
+
+    def take_results(self) -> list[tuple[str, Optional[list[dict]]]]:
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self.db.execute("SELECT link, result FROM tasks WHERE state = 'done'").fetchall()
+                self.db.execute("UPDATE tasks SET state = 'merged', result = NULL WHERE state = 'done'")
+            finally:
+                self.db.execute('COMMIT')
+        return [(link, json.loads(result)) for link, result in rows]
+
+    def close(self):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('closed', '1')")
+
+    def is_closed(self) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'closed'").fetchone() is not None
+
+    def unfinished(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM tasks WHERE state != 'merged'").fetchone()[0]
+
+    def disconnect(self):
+        with self.lock:
+            self.db.close()
+
+
+class RedisWorkQueue:
+    """Queue in a Redis-compatible service shared by the nodes. Requires the redis package."""
+
+    # Taking a link and leasing it must be atomic, otherwise unfinished() misses the link in between
+    TAKE_SCRIPT = "local item = redis.call('LPOP', KEYS[1]) " \
+                  "if item then redis.call('HSET', KEYS[2], item, ARGV[1]) end return item"
+    REQUEUE_SCRIPT = "if redis.call('HDEL', KEYS[2], ARGV[1]) == 1 then redis.call('RPUSH', KEYS[1], ARGV[1]) end"
+
+    def __init__(self, url: str, name: str, lease_timeout: float = LEASE_TIMEOUT):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.lease_timeout = lease_timeout
+        self.links_key, self.taken_key, self.results_key, self.closed_key = (
+            f'{name}:{key}' for key in ('links', 'taken', 'results', 'closed'))
+        self.take_script = self.redis.register_script(self.TAKE_SCRIPT)
+        self.requeue_script = self.redis.register_script(self.REQUEUE_SCRIPT)
+
+    def reset(self):
+        self.redis.delete(self.links_key, self.taken_key, self.results_key, self.closed_key)
+
+    def put(self, link: str, category: Optional[str] = None):
+        self.redis.rpush(self.links_key, json.dumps([link, category], ensure_ascii=False))
+
+    def take(self) -> Optional[tuple[str, Optional[str]]]:
+        now = time.time()
+        item = self.take_script(keys=[self.links_key, self.taken_key], args=[now])
+        if item is None:
+            for expired, taken in self.redis.hgetall(self.taken_key).items():
+                if float(taken) < now - self.lease_timeout:
+                    self.requeue_script(keys=[self.links_key, self.taken_key], args=[expired])
+            return None
+        link, category = json.loads(item)
+        return link, category
+
+    def done(self, link: str, products: Optional[list[dict]]):
+        with self.redis.pipeline() as pipe:
+            for item in self.redis.hkeys(self.taken_key):
+                if json.loads(item)[0] == link:
+                    pipe.hdel(self.taken_key, item)
+            pipe.rpush(self.results_key, json.dumps([link, products], ensure_ascii=False))
+            pipe.execute()
+
+    def take_results(self) -> list[tuple[str, Optional[list[dict]]]]:
+        with self.redis.pipeline() as pipe:
+            pipe.lrange(self.results_key, 0, -1)
+            pipe.delete(self.results_key)
+            items, _ = pipe.execute()
+        return [tuple(json.loads(item)) for item in items]
+
+    def close(self):
+        self.redis.set(self.closed_key, 1)
+
+    def is_closed(self) -> bool:
+        return bool(self.redis.exists(self.closed_key))
+
+    def unfinished(self) -> int:
+        with self.redis.pipeline() as pipe:
+            pipe.llen(self.links_key)
+            pipe.hlen(self.taken_key)
+            pipe.llen(self.results_key)
+            return sum(pipe.execute())
+
+    def disconnect(self):
+        self.redis.close()
+
+
+def open_work_queue(url: str, name: str) -> MemoryWorkQueue | SQLiteWorkQueue | RedisWorkQueue:
+    """Opens the queue by its URL, name separates the queues of different sites on one Redis server."""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisWorkQueue(url, name)
+    if url == 'memory://':
+        return MemoryWorkQueue()
+    return SQLiteWorkQueue(url)
@@ -0,0 +1,406 @@
+"""
+Declarative site definitions: the selectors of the category, listing and product data are compiled once into
+matchers evaluated in a single pass over the page HTML, without building a tree.
+
+Selectors are a CSS subset: tag.class#id[attr][attr=value] compounds with descendant and child (>) combinators,
+without spaces inside attribute values, and @attr at the end to take an attribute instead of the text.
+A field is a selector, a list of fallback selectors or a dict with:
+    select - selector or list of fallback selectors, the first one that matches is used
+    json - dotted path in the JSON content of the element, e.g. offers.0.price for JSON-LD
+    transform - name or list of names of TRANSFORMS, or price for Parser.get_price
+    map - lowercase substring of the value -> value, otherwise default. The keys are checked in order and the first
+        one found wins, so put the negative phrases first, e.g. {'немає': '-', 'в наявності': '+'}
+    default - value of a field that does not match
+    many - all the matches instead of the first one, the default for the links fields
+
+Run a site defined in a YAML or JSON file: python site_spec.py <spec file> [--reprice | --record | ...]
+Check the extraction on the tricky markup of EXTRACTION_CHECKS after changing it: python site_spec.py --check
+"""
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Callable, Optional
+from urllib.parse import urljoin
+
+from parser import Parser, Product
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track',
+                 'wbr'}
+RAW_TEXT_ELEMENTS = {'script', 'style'}  # their content is the text of the element only, e.g. JSON-LD
+# Start tag -> open elements it closes (their end tags are optional) unless one of the boundaries is met first
+IMPLIED_END_TAGS = {
+    'li': ({'li'}, {'ul', 'ol', 'menu'}),
+    'dt': ({'dt', 'dd'}, {'dl'}),
+    'dd': ({'dt', 'dd'}, {'dl'}),
+    'option': ({'option'}, {'select', 'datalist', 'optgroup'}),
+    'optgroup': ({'option', 'optgroup'}, {'select'}),
+    'tr': ({'tr', 'td', 'th'}, {'table', 'thead', 'tbody', 'tfoot'}),
+    'td': ({'td', 'th'}, {'tr', 'table'}),
+    'th': ({'td', 'th'}, {'tr', 'table'}),
+    'thead': ({'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'}, {'table'}),
+    'tbody': ({'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'}, {'table'}),
+    'tfoot': ({'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'}, {'table'}),
+}
+# Start tags closing an open p, and the elements p is not closed across, as in browsers
+P_CLOSING_TAGS = {'address', 'article', 'aside', 'blockquote', 'details', 'dialog', 'div', 'dl', 'dd', 'dt',
+                  'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+                  'hgroup', 'hr', 'li', 'main', 'menu', 'nav', 'ol', 'p', 'pre', 'section', 'summary', 'table', 'ul'}
+P_SCOPE_BOUNDARIES = {'button', 'table', 'td', 'th', 'caption', 'marquee', 'object', 'applet', 'template', 'html'}
+COMPOUND_PART = re.compile(r'#([\w-]+)|\.([\w-]+)|\[([\w:-]+)(?:=(?:"([^"]*)"|\'([^\']*)\'|([^\]]*)))?\]')
+TRANSFORMS = {
+    'strip': str.strip,
+    'lower': str.lower,
+    'int': lambda value: int(float(value)),
+    'float': float,
+}
+
+
+@dataclass
+class SimpleSelector:
+    tag: Optional[str] = None
+    id: Optional[str] = None
+    classes: list[str] = field(default_factory=list)
+    attrs: list[tuple[str, Optional[str]]] = field(default_factory=list)  # (name, value or None for any)
+
+    @classmethod
+    def parse(cls, text: str) -> 'SimpleSelector':
+        selector = cls()
+        tag = re.match(r'[\w-]+|\*', text)
+        position = 0
+        if tag:
+            selector.tag = None if tag.group() == '*' else tag.group().lower()
+            position = tag.end()
+        for part in COMPOUND_PART.finditer(text, position):
+            if part.start() != position:
+                break
+            id_, class_, attr, *values = part.groups()
+            if id_:
+                selector.id = id_
+            elif class_:
+                selector.classes.append(class_)
+            else:
+                selector.attrs.append((attr.lower(), next((value for value in values if value is not None), None)))
+            position = part.end()
+        if position != len(text):
+            raise ValueError(f'Unsupported selector {text}')
+        return selector
+
+    def matches(self, tag: str, attrs: dict) -> bool:
+        if self.tag and tag != self.tag:
+            return False
+        if self.id and attrs.get('id') != self.id:
+            return False
+        if self.classes:
+            element_classes = (attrs.get('class') or '').split()
+            if not all(class_ in element_classes for class_ in self.classes):
+                return False
+        return all(name in attrs and (value is None or attrs[name] == value) for name, value in self.attrs)
+
+
+@dataclass
+class Selector:
+    parts: list[tuple[str, SimpleSelector]]  # (combinator with the previous part, compound), the last is the element
+    attribute: Optional[str] = None
+
+    @classmethod
+    def parse(cls, text: str) -> 'Selector':
+        text, _, attribute = text.partition('@')
+        parts = []
+        combinator = ' '
+        for token in re.findall(r'>|[^\s>]+', text):
+            if token == '>':
+                combinator = '>'
+            else:
+                parts.append((combinator, SimpleSelector.parse(token)))
+                combinator = ' '
+        if not parts:
+            raise ValueError(f'Empty selector {text}')
+        return cls(parts, attribute.lower() or None)
+
+    @property
+    def tag(self) -> Optional[str]:
+        return self.parts[-1][1].tag
+
+    def matches(self, stack: list[tuple[str, dict]]) -> bool:
+        """Matches the element on top of the stack of the open elements."""
+        return self._matches(len(self.parts) - 1, len(stack) - 1, stack)
+
+    def _matches(self, part: int, position: int, stack: list[tuple[str, dict]]) -> bool:
+        combinator, compound = self.parts[part]
+        if not compound.matches(*stack[position]):
+            return False
+        if part == 0:
+            return True
+        if combinator == '>':
+            return position > 0 and self._matches(part - 1, position - 1, stack)
+        return any(self._matches(part - 1, ancestor, stack) for ancestor in range(position - 1, -1, -1))
+
+
+def get_json_path(value: Any, path: str) -> Any:
+    for key in path.split('.'):
+        value = value[int(key)] if isinstance(value, list) else value[key]
+    return value
+
+
+@dataclass
+class Field:
+    name: str
+    selectors: list[Selector]  # fallbacks
+    json: Optional[str] = None
+    transforms: list[Callable] = field(default_factory=list)
+    map: Optional[dict] = None
+    default: Any = None
+    many: bool = False
+
+    def convert(self, text: str) -> Any:
+        """Returns the value of a match, None if it has no value, e.g. a JSON block without the path."""
+        try:
+            value = get_json_path(json.loads(text), self.json) if self.json else ' '.join(text.split())
+            for transform in self.transforms:
+                value = transform(value)
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+        if self.map is not None:
+            value = next((mapped for part, mapped in self.map.items() if part in str(value).lower()), self.default)
+        return value
+
+    def value(self, matches: list[list[str]]) -> Any:
+        """Returns the value of the first fallback with a value."""
+        for fallback_matches in matches:
+            values = [value for value in map(self.convert, fallback_matches) if value is not None]
+            if values:
+                return values if self.many else values[0]
+        return [] if self.many else self.default
+
+
+def compile_field(name: str, spec: str | list | dict, transforms: dict, many: bool = False) -> Field:
+    if not isinstance(spec, dict):
+        spec = {'select': spec}
+    selects = spec['select'] if isinstance(spec['select'], list) else [spec['select']]
+    transform_names = spec.get('transform', [])
+    if isinstance(transform_names, str):
+        transform_names = [transform_names]
+    unknown = [transform for transform in transform_names if transform not in transforms]
+    if unknown:
+        raise ValueError(f'Unknown transforms {unknown} of {name}')
+    return Field(name=name, selectors=[Selector.parse(select) for select in selects], json=spec.get('json'),
+                 transforms=[transforms[transform] for transform in transform_names], map=spec.get('map'),
+                 default=spec.get('default'), many=spec.get('many', many))
+
+
+class SinglePassParser(HTMLParser):
+    """Collects the matches of all the fields of a section in one pass over the HTML."""
+
+    def __init__(self, section: 'CompiledSection'):
+        super().__init__(convert_charrefs=True)
+        self.section = section
+        self.stack = []  # (tag, attrs) of the open elements
+        self.captures = []  # (depth, texts, position in texts, text parts) of the matched elements being read
+        self.matches = {}  # (field index, fallback) -> texts in document order, None while being read
+
+    def handle_starttag(self, tag, attrs):
+        self._close_implied(tag)
+        self.stack.append((tag, dict(attrs)))
+        self._match(tag)
+        if tag in VOID_ELEMENTS:
+            self._close(len(self.stack) - 1)
+
+    def handle_startendtag(self, tag, attrs):
+        self._close_implied(tag)
+        self.stack.append((tag, dict(attrs)))
+        self._match(tag)
+        self._close(len(self.stack) - 1)
+
+    def handle_endtag(self, tag):
+        for position in range(len(self.stack) - 1, -1, -1):  # closes the elements left open inside too
+            if self.stack[position][0] == tag:
+                self._close(position)
+                return
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1][0] in RAW_TEXT_ELEMENTS:  # not a part of the text of the parents
+            for capture in self.captures:
+                if capture[0] == len(self.stack):
+                    capture[3].append(data)
+            return
+        for capture in self.captures:
+            capture[3].append(data)
+
+    def close(self):
+        super().close()
+        self._close(0)
+
+    def _close_implied(self, tag: str):
+        """Closes the elements whose end tags are omitted before the start tag, e.g. the previous li."""
+        if tag in IMPLIED_END_TAGS:
+            self._close_open(*IMPLIED_END_TAGS[tag])
+        if tag in P_CLOSING_TAGS:
+            self._close_open({'p'}, P_SCOPE_BOUNDARIES)
+
+    def _close_open(self, tags: set[str], boundaries: set[str]):
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position][0] in tags:
+                self._close(position)
+                return
+            if self.stack[position][0] in boundaries:
+                return
+
+    def _match(self, tag: str):
+        for key in (tag, None):
+            for index, fallback, selector, first_only in self.section.matchers.get(key, ()):
+                if first_only and (index, fallback) in self.matches:
+                    continue
+                if selector.matches(self.stack):
+                    if selector.attribute:
+                        if (value := self.stack[-1][1].get(selector.attribute)) is not None:
+                            self.matches.setdefault((index, fallback), []).append(value)
+                    else:  # the place is kept at the start, nested matches of the selector are closed earlier
+                        texts = self.matches.setdefault((index, fallback), [])
+                        texts.append(None)
+                        self.captures.append((len(self.stack), texts, len(texts) - 1, []))
+
+    def _close(self, position: int):
+        del self.stack[position:]
+        if self.captures:
+            open_captures = []
+            for capture in self.captures:
+                depth, texts, text_position, parts = capture
+                if depth > position:
+                    texts[text_position] = ''.join(parts)
+                else:
+                    open_captures.append(capture)
+            self.captures = open_captures
+
+
+class CompiledSection:
+    """Fields of a page kind compiled into matchers indexed by the tag of the matched element."""
+
+    def __init__(self, spec: dict, transforms: dict, many_fields: set[str] = frozenset()):
+        self.fields = [compile_field(name, field_spec, transforms, name in many_fields)
+                       for name, field_spec in spec.items()]
+        self.matchers = {}  # tag or None for any tag -> (field index, fallback, selector, first match only)
+        for index, compiled in enumerate(self.fields):
+            first_only = not compiled.many and not compiled.json
+            for fallback, selector in enumerate(compiled.selectors):
+                self.matchers.setdefault(selector.tag, []).append((index, fallback, selector, first_only))
+
+    def extract(self, html: str) -> dict:
+        parser = SinglePassParser(self)
+        parser.feed(html)
+        parser.close()
+        return {compiled.name: compiled.value([parser.matches.get((index, fallback), [])
+                                               for fallback in range(len(compiled.selectors))])
+                for index, compiled in enumerate(self.fields)}
+
+
+class SpecParser(Parser):
+    """
+    Parser of a site defined by spec with the sections:
+        categories - links of the categories on the site page
+        listing - links of the products on a category page; page_url appended to the category link with {page},
+            and next, the element present on every page but the last, for paginated categories
+        product - name, art, price, old_price and available of the product on its page
+    """
+
+    spec: dict = {}
+
+    def __init__(self):
+        super().__init__()
+        transforms = {**TRANSFORMS, 'price': lambda value: self.get_price(str(value))}
+        listing = {name: value for name, value in self.spec['listing'].items() if name != 'page_url'}
+        self.categories_section = CompiledSection(self.spec['categories'], transforms, {'links'})
+        self.listing_section = CompiledSection(listing, transforms, {'links'})
+        self.product_section = CompiledSection(self.spec['product'], transforms)
+
+    async def get_categories_links(self, link: str) -> list[str]:
+        links = self.categories_section.extract(await self.get_page(link))['links']
+        return [urljoin(link, category_link) for category_link in links]
+
+    async def get_products_links(self, category_link: str) -> list[str]:
+        first_page_url = category_link + self.max_products_per_page
+        if not (page_url := self.spec['listing'].get('page_url')):
+            links = self.listing_section.extract(await self.get_page(first_page_url))['links']
+            return [urljoin(category_link, link) for link in links]
+
+        listing = {}  # the last parsed page, is_last_page is called right after parse_page for the same page
+
+        def parse_page(html: str) -> list[str]:
+            listing.update(self.listing_section.extract(html))
+            return listing['links']
+
+        links = await self.get_paginated_links(
+            lambda page: first_page_url if page == 1 else category_link + page_url.format(page=page), parse_page,
+            is_last_page=lambda html: 'next' in listing and listing['next'] is None, as_html=True)
+        return [urljoin(category_link, link) for link in links]
+
+    async def get_product_info(self, product_link: str) -> list[Product]:
+        product = self.product_section.extract(await self.get_page(product_link))
+        if not product.get('name') and not product.get('art'):
+            return []
+        return [Product(name=product.get('name'),
+                        art=product.get('art'),
+                        price=self._get_number(product.get('price')) or 0,
+                        old_price=self._get_number(product.get('old_price')),
+                        available=product.get('available') or '-',
+                        link=product_link,
+                        variant=None)]
+
+    def _get_number(self, value: Any) -> Optional[int | float]:
+        """Prices extracted without transform: price, e.g. '1 299 грн', are parsed with get_price for pricing_rules."""
+        if value is None or isinstance(value, (int, float)):
+            return value
+        try:
+            return self.get_price(str(value))
+        except ValueError:  # no digits
+            return None
+
+
+# (fields, html, expected values) of the markup the single pass has to handle like a browser
+EXTRACTION_CHECKS = [
+    ({'name': 'p.name', 'price': 'div.price'},  # p closed by a block start tag
+     '<p class="name">Foo<div class="price">100</div>',
+     {'name': 'Foo', 'price': '100'}),
+    ({'links': {'select': 'ul.menu > li > a@href', 'many': True}},  # li without end tags
+     '<ul class="menu"><li><a href="/a">A<li><a href="/b">B<li><ul><li><a href="/c">C</ul></ul>',
+     {'links': ['/a', '/b']}),
+    ({'price': 'div.price', 'offers': {'select': 'script[type=application/ld+json]', 'json': 'price'}},
+     '<div class="price"><script type="application/ld+json">{"price": 100}</script><style>b {}</style>100 грн</div>',
+     {'price': '100 грн', 'offers': 100}),
+    ({'text': 'div.x', 'texts': {'select': 'div.x', 'many': True}},  # nested matches in document order
+     '<div class="x">outer<div class="x">inner</div></div>',
+     {'text': 'outerinner', 'texts': ['outerinner', 'inner']}),
+]
+
+
+def check_extraction() -> bool:
+    """Runs EXTRACTION_CHECKS, prints the failed ones. Returns False if any failed."""
+    passed = True
+    for fields, html, expected in EXTRACTION_CHECKS:
+        if (extracted := CompiledSection(fields, TRANSFORMS).extract(html)) != expected:
+            print(f'FAILED {html}\n  expected {expected}\n  extracted {extracted}')
+            passed = False
+    return passed
+
+
+def load_spec(path: str | Path) -> dict:
+    """Reads a YAML (requires PyYAML) or JSON spec file."""
+    text = Path(path).read_text(encoding='utf-8')
+    if Path(path).suffix in ('.yaml', '.yml'):
+        import yaml
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def site_from_spec(spec: dict) -> type[SpecParser]:
+    """Creates the parser class of the spec. Parser settings, e.g. compared_product_field, are under settings."""
+    return type('Site', (SpecParser,), {'spec': spec, 'site': spec['site'], 'price_file': spec['price_file'],
+                                        **spec.get('settings', {})})
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--check':
+        sys.exit(0 if check_extraction() else 1)
+    site_from_spec(load_spec(sys.argv[1]))().parse()
@@ -1,4 +1,5 @@
 from parser import Parser, Product
+from pricing import PriceRule, PricingRules
 import json
 import datetime
 
@@ -12,10 +13,10 @@ class Site(Parser):
     price_file = 'sunuv.in.ua.xlsx'
     site = 'https://sunuv.in.ua/'
     compared_product_field = 'name'
+    pricing_rules = PricingRules(PriceRule(offset=-100, multiplier=1.25, floor=0))
 
-    def get_price(self, price) -> int:
-        our_price = int(round((float(price) - 100) * 1.25, 0))
-        return our_price if our_price > 0 else 0
+    def get_price(self, price) -> float:
+        return float(price)
 
     async def get_categories_links(self, link: str) -> list[str]:
         soup = await self.get_soup(link)
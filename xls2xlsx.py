@@ -2,6 +2,9 @@
 # wb = XLS2XLSX(file).to_xlsx()
 from datetime import datetime, date, timedelta
 from datetime import time as tm
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Border, Alignment, Font, Side, Color, Protection
 from openpyxl.comments import Comment
@@ -12,11 +15,72 @@ import requests
 from time import sleep
 import os
 import copy  # Issue #4
+import mmap
 import xlrd
 from pathlib import Path
+import htmlxls2xlsx
 
 RETRIES = 6
 
+FILL_PATTERNS = {0x00: 'none', 0x01: 'solid', 0x02: 'mediumGray', 0x03: 'darkGray', 0x04: 'lightGray',
+                 0x05: 'darkHorizontal', 0x06: 'darkVertical', 0x07: 'darkDown', 0x08: 'darkUp',
+                 0x09: 'darkGrid',
+                 0x0A: 'darkTrellis', 0x0B: 'lightHorizontal', 0x0C: 'lightVertical', 0x0D: 'lightDown',
+                 0x0E: 'lightUp',
+                 0x0F: 'lightGrid', 0x10: 'lightTrellis', 0x11: 'gray125', 0x12: 'gray0625'
+                 }
+HORIZONTAL_ALIGNMENTS = {0: 'general', 1: 'left', 2: 'center', 3: 'right', 4: 'fill', 5: 'justify',
+                         6: 'centerContinuous', 7: 'distributed'}
+VERTICAL_ALIGNMENTS = {0: 'top', 1: 'center', 2: 'bottom', 3: 'justify', 4: 'distributed'}
+BORDER_STYLES = {0: None, 1: 'thin', 2: 'medium', 3: 'dashed', 4: 'dotted',
+                 5: 'thick', 6: 'double', 7: 'hair', 8: 'mediumDashed', 9: 'dashDot',
+                 10: 'mediumDashDot', 11: 'dashDotDot', 12: 'mediumDashDotDot',
+                 13: 'slantDashDot', }
+
+
+@dataclass
+class SheetData:
+    """Picklable copy of a converted xlrd sheet, produced by worker processes (see convert_sheet).
+    It provides the subset of the xlrd Sheet interface used by XLS2XLSX.to_xlsx"""
+    name: str
+    rows: list  # converted cell values, one tuple per row
+    xf_indexes: list | None  # xf index of every cell, None for values only conversion
+    colinfo_map: dict
+    rowinfo_map: dict
+    merged_cells: list
+    hyperlink_map: dict
+    cell_note_map: dict
+    visibility: int
+    vert_split_pos: int
+    horz_split_pos: int
+
+    def cell_xf_index(self, row, col):
+        return self.xf_indexes[row][col]
+
+
+def convert_sheet(source, sheet_ndx, values_only=False, ignore_workbook_corruption=False) -> SheetData:
+    """Convert a single sheet of an xls file (path or contents) in a worker process"""
+    converter = XLS2XLSX(source, values_only=values_only, sheets=sheet_ndx,
+                         ignore_workbook_corruption=ignore_workbook_corruption)
+    try:
+        sheet = converter.book.sheet_by_index(sheet_ndx)
+        xf_indexes = None
+        if not values_only:
+            xf_indexes = [[sheet.cell_xf_index(row, col) for col in range(sheet.ncols)] for row in range(sheet.nrows)]
+        return SheetData(name=sheet.name,
+                         rows=list(converter.iter_rows(sheet, empty=None if values_only else '')),
+                         xf_indexes=xf_indexes,
+                         colinfo_map=sheet.colinfo_map,
+                         rowinfo_map=sheet.rowinfo_map,
+                         merged_cells=sheet.merged_cells,
+                         hyperlink_map=sheet.hyperlink_map,
+                         cell_note_map=sheet.cell_note_map,
+                         visibility=sheet.visibility,
+                         vert_split_pos=sheet.vert_split_pos,
+                         horz_split_pos=sheet.horz_split_pos)
+    finally:
+        converter.close()
+
 
 class XLS2XLSX:
     """Convert an xls file into an xlsx file.  Everything is supported except for the things
@@ -28,28 +92,44 @@ class XLS2XLSX:
        If this xls file is in html format, then we call HTMLXLS2XLSX to convert it.
         """
 
-    def __init__(self, f, dirname='.', ignore_workbook_corruption=False):
-        """f is a url, filename, file object, or xls file contents as a bytes object"""
+    def __init__(self, f, dirname='.', ignore_workbook_corruption=False, values_only=False, sheets=None):
+        """f is a url, filename, file object, or xls file contents as a bytes object.
+        If values_only is True, formatting is not read and only the cell values are converted.
+        sheets is a sheet name or index, or a list of them, to convert only those sheets"""
         self.dirname = dirname
         self.ignore_workbook_corruption = ignore_workbook_corruption
+        self.values_only = values_only
+        self.sheets = [sheets] if isinstance(sheets, (str, int)) else sheets
         if isinstance(f, bytes):
             self.contents = f
         elif isinstance(f, Path):
-            self.contents = f.read_bytes()
+            self.contents = XLS2XLSX.map_file(f)
+        elif isinstance(f, str) and '://' not in f:
+            self.dirname = os.path.split(f)[0]
+            self.contents = XLS2XLSX.map_file(f)
+            f = Path(f)
         else:
             if isinstance(f, str):
                 self.dirname = os.path.split(f)[0]
             self.contents = XLS2XLSX.read(f)
+        # what worker processes reopen for parallel conversion: the local file, else the contents
+        self.source = f if isinstance(f, Path) else bytes(self.contents)
 
         self.h2x = None
+        self.styles = {}  # xf_ndx -> shared 6-tuple of styles, see cached_style()
+        self.wrapped_alignments = {}  # xf_ndx -> shared wrap_text copy of the alignment
+        if htmlxls2xlsx.is_html(self.contents):
+            self.h2x = htmlxls2xlsx.HTMLXLS2XLSX(self.contents, sheets=self.sheets)
+            self.book = None
+            return
         try:
-            self.book = xlrd.open_workbook(file_contents=self.contents, formatting_info=True,
-                                           ignore_workbook_corruption=ignore_workbook_corruption)
+            self.book = xlrd.open_workbook(file_contents=self.contents, formatting_info=not values_only,
+                                           on_demand=True, ignore_workbook_corruption=ignore_workbook_corruption)
             self.date_mode = self.book.datemode
         except xlrd.compdoc.CompDocError:
             try:
-                self.book = xlrd.open_workbook(file_contents=self.contents, formatting_info=True,
-                                               ignore_workbook_corruption=True)
+                self.book = xlrd.open_workbook(file_contents=self.contents, formatting_info=not values_only,
+                                               on_demand=True, ignore_workbook_corruption=True)
                 self.date_mode = self.book.datemode
             except Exception:
                 self.book = None  # completely ignore corruption that cannot be corrected
@@ -73,6 +153,62 @@ class XLS2XLSX:
         else:
             return f.read()
 
+    @staticmethod
+    def map_file(path):
+        """Memory-map a local file read-only instead of copying its contents into memory"""
+        with open(path, 'rb') as t:
+            try:
+                return mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file cannot be mapped
+                return t.read()
+
+    def close(self):
+        """Release the xlrd book and the memory-mapped file contents"""
+        if self.book is not None:
+            self.book.release_resources()
+        if isinstance(self.contents, mmap.mmap):
+            self.contents.close()
+
+    def sheet_indexes(self):
+        """Indexes of the sheets to convert: the selected ones by name or index, else all of them"""
+        if self.sheets is None:
+            return list(range(self.book.nsheets))
+        names = self.book.sheet_names()
+        indexes = []
+        for sheet in self.sheets:
+            if isinstance(sheet, str):
+                if sheet not in names:
+                    raise ValueError(f'Sheet {sheet!r} not found, available sheets: {names}')
+                sheet = names.index(sheet)
+            indexes.append(sheet)
+        return indexes
+
+    def iter_sheets(self):
+        """Load the selected sheets one at a time on demand and unload each one once it has been converted"""
+        for ndx in self.sheet_indexes():
+            sheet = self.book.sheet_by_index(ndx)
+            try:
+                yield sheet
+            finally:
+                self.book.unload_sheet(ndx)
+
+    def converted_sheets(self, processes=None):
+        """Yield the selected sheets in order.  With processes > 1 the sheets are converted in parallel
+        worker processes and yielded as SheetData, else the xlrd sheets are loaded on demand one by one"""
+        indexes = self.sheet_indexes()
+        if not processes or processes < 2 or len(indexes) < 2:
+            yield from self.iter_sheets()
+            return
+        with ProcessPoolExecutor(max_workers=min(processes, len(indexes))) as executor:
+            yield from executor.map(convert_sheet, repeat(self.source), indexes, repeat(self.values_only),
+                                    repeat(self.ignore_workbook_corruption))
+
+    def sheet_rows(self, sheet, empty=''):
+        """Converted rows of an xlrd sheet or of a SheetData from a worker process"""
+        if isinstance(sheet, SheetData):
+            return sheet.rows
+        return self.iter_rows(sheet, empty=empty)
+
     def xls_date_to_xlsx(self, value):
         date_tuple = xlrd.xldate_as_tuple(value, self.date_mode)
         if date_tuple == (0, 0, 0, 0, 0, 0):
@@ -83,6 +219,37 @@ class XLS2XLSX:
             return date(date_tuple[0], date_tuple[1], date_tuple[2])
         return datetime(date_tuple[0], date_tuple[1], date_tuple[2], date_tuple[3], date_tuple[4], date_tuple[5])
 
+    def xls_value_to_xlsx(self, cell_type, value, empty=''):
+        """Convert an xls cell value of the given xlrd cell type into an xlsx value"""
+        if cell_type == xlrd.XL_CELL_DATE:
+            try:  # Issue #5: Just keep 'bad' dates as float numbers
+                value = self.xls_date_to_xlsx(value)
+            except Exception:
+                pass
+        elif cell_type == xlrd.XL_CELL_NUMBER:
+            try:
+                ival = int(value)
+                if ival == value:
+                    value = ival
+            except Exception:
+                pass
+        elif cell_type == xlrd.XL_CELL_ERROR:
+            if value in xlrd.biffh.error_text_from_code:
+                value = xlrd.biffh.error_text_from_code[value]
+            else:
+                value = '#N/A'
+        elif cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+            value = empty
+        elif cell_type == xlrd.XL_CELL_BOOLEAN:
+            value = ('false', 'true')[value]
+        return value
+
+    def iter_rows(self, sheet, empty=None):
+        """Yield the converted values of an xlrd sheet row by row as tuples.  Empty cells are set to empty"""
+        for row in range(sheet.nrows):
+            yield tuple(self.xls_value_to_xlsx(cell_type, value, empty=empty)
+                        for cell_type, value in zip(sheet.row_types(row), sheet.row_values(row)))
+
     def xls_color_to_xlsx(self, color_ndx):
         black = (0, 0, 0)
         color_tuple = self.book.colour_map.get(color_ndx, black)
@@ -132,27 +299,17 @@ class XLS2XLSX:
                 protection.locked = xf.protection.cell_locked
             protection.hidden = xf.protection.formula_hidden
 
-            fill_patterns = {0x00: 'none', 0x01: 'solid', 0x02: 'mediumGray', 0x03: 'darkGray', 0x04: 'lightGray',
-                             0x05: 'darkHorizontal', 0x06: 'darkVertical', 0x07: 'darkDown', 0x08: 'darkUp',
-                             0x09: 'darkGrid',
-                             0x0A: 'darkTrellis', 0x0B: 'lightHorizontal', 0x0C: 'lightVertical', 0x0D: 'lightDown',
-                             0x0E: 'lightUp',
-                             0x0F: 'lightGrid', 0x10: 'lightTrellis', 0x11: 'gray125', 0x12: 'gray0625'
-                             }
             fill_pattern = xf.background.fill_pattern
             fill_background_color = self.xls_color_to_xlsx(xf.background.background_colour_index)
             fill_pattern_color = self.xls_color_to_xlsx(xf.background.pattern_colour_index)
-            fill.patternType = fill_patterns.get(fill_pattern, 'none')
+            fill.patternType = FILL_PATTERNS.get(fill_pattern, 'none')
             fill.bgColor = fill_background_color
             fill.fgColor = fill_pattern_color
 
-            horizontal = {0: 'general', 1: 'left', 2: 'center', 3: 'right', 4: 'fill', 5: 'justify',
-                          6: 'centerContinuous', 7: 'distributed'}
-            vertical = {0: 'top', 1: 'center', 2: 'bottom', 3: 'justify', 4: 'distributed'}
-            hor_align = horizontal.get(xf.alignment.hor_align, None)
+            hor_align = HORIZONTAL_ALIGNMENTS.get(xf.alignment.hor_align, None)
             if hor_align:
                 alignment.horizontal = hor_align
-            vert_align = vertical.get(xf.alignment.vert_align, None)
+            vert_align = VERTICAL_ALIGNMENTS.get(xf.alignment.vert_align, None)
             if vert_align:
                 alignment.vertical = vert_align
             alignment.textRotation = xf.alignment.rotation
@@ -160,20 +317,16 @@ class XLS2XLSX:
             alignment.indent = xf.alignment.indent_level
             alignment.shrink_to_fit = xf.alignment.shrink_to_fit
 
-            border_styles = {0: None, 1: 'thin', 2: 'medium', 3: 'dashed', 4: 'dotted',
-                             5: 'thick', 6: 'double', 7: 'hair', 8: 'mediumDashed', 9: 'dashDot',
-                             10: 'mediumDashDot', 11: 'dashDotDot', 12: 'mediumDashDotDot',
-                             13: 'slantDashDot', }
             xls_border = xf.border
-            top = Side(style=border_styles.get(xls_border.top_line_style),
+            top = Side(style=BORDER_STYLES.get(xls_border.top_line_style),
                        color=self.xls_color_to_xlsx(xls_border.top_colour_index))
-            bottom = Side(style=border_styles.get(xls_border.bottom_line_style),
+            bottom = Side(style=BORDER_STYLES.get(xls_border.bottom_line_style),
                           color=self.xls_color_to_xlsx(xls_border.bottom_colour_index))
-            left = Side(style=border_styles.get(xls_border.left_line_style),
+            left = Side(style=BORDER_STYLES.get(xls_border.left_line_style),
                         color=self.xls_color_to_xlsx(xls_border.left_colour_index))
-            right = Side(style=border_styles.get(xls_border.right_line_style),
+            right = Side(style=BORDER_STYLES.get(xls_border.right_line_style),
                          color=self.xls_color_to_xlsx(xls_border.right_colour_index))
-            diag = Side(style=border_styles.get(xls_border.diag_line_style),
+            diag = Side(style=BORDER_STYLES.get(xls_border.diag_line_style),
                         color=self.xls_color_to_xlsx(xls_border.diag_colour_index))
             border.top = top
             border.bottom = bottom
@@ -185,9 +338,49 @@ class XLS2XLSX:
 
         return (font, fill, border, alignment, number_format, protection)
 
-    def to_xlsx(self, filename=None):
+    def cached_style(self, xf_ndx):
+        """Return the 6-tuple of xls_style_to_xlsx() for xf_ndx, computed once per workbook.
+        The returned style objects are shared between cells, so they must not be modified"""
+        style = self.styles.get(xf_ndx)
+        if style is None:
+            style = self.styles[xf_ndx] = self.xls_style_to_xlsx(xf_ndx)
+        return style
+
+    def wrapped_alignment(self, xf_ndx, alignment):
+        """Return a shared copy of alignment with wrap_text turned on (Issue #4)"""
+        wrapped = self.wrapped_alignments.get(xf_ndx)
+        if wrapped is None:
+            wrapped = copy.deepcopy(alignment)
+            wrapped.wrap_text = True
+            self.wrapped_alignments[xf_ndx] = wrapped
+        return wrapped
+
+    def values_to_xlsx(self, filename=None, processes=None):
+        """Convert cell values only.  If filename is given, the rows are streamed into a write-only
+        workbook saved to that file, else a regular workbook filled with ws.append() is returned"""
+        wb = Workbook(write_only=bool(filename))
+        if self.date_mode:
+            wb.epoch = CALENDAR_MAC_1904
+        ws = None if filename else wb.active
+
+        for sheet in self.converted_sheets(processes):
+            if ws:
+                ws.title = sheet.name
+            else:
+                ws = wb.create_sheet(sheet.name)
+            for row in self.sheet_rows(sheet, empty=None):
+                ws.append(row)
+            ws = None
+
+        if filename:
+            wb.save(filename=filename)
+            return filename
+        return wb
+
+    def to_xlsx(self, filename=None, processes=None):
         """Convert to xlsx using openpyxl.  If filename is not None, then the result
         is written to that file, and the filename is returned, else the workbook is returned.
+        If processes > 1, multiple sheets are converted in parallel by that many worker processes.
         """
 
         if self.h2x:
@@ -196,6 +389,9 @@ class XLS2XLSX:
         if self.book is None and self.ignore_workbook_corruption:
             return None  # Couldn't be loaded - nothing we can do
 
+        if self.values_only:
+            return self.values_to_xlsx(filename=filename, processes=processes)
+
         wb = Workbook()  # creates one worksheet
         ws = wb.active
 
@@ -203,7 +399,7 @@ class XLS2XLSX:
         if self.date_mode:
             wb.epoch = CALENDAR_MAC_1904
 
-        for sheet in self.book.sheets():
+        for sheet in self.converted_sheets(processes):
             if ws:
                 ws.title = sheet.name
             else:
@@ -224,46 +420,19 @@ class XLS2XLSX:
                 ws.row_dimensions[row].thickTop = info.additional_space_above
                 ws.row_dimensions[row].thickBot = info.additional_space_below
 
-            rows = sheet.nrows
-            columns = sheet.ncols
-
-            for row in range(rows):
-                for col in range(columns):
-                    cell_type = sheet.cell_type(row, col)
-                    value = sheet.cell_value(row, col)
-                    if cell_type == xlrd.XL_CELL_DATE:
-                        try:  # Issue #5: Just keep 'bad' dates as float numbers
-                            value = self.xls_date_to_xlsx(value)
-                        except Exception:
-                            pass
-                    elif cell_type == xlrd.XL_CELL_NUMBER:
-                        try:
-                            ival = int(value)
-                            if ival == value:
-                                value = ival
-                        except Exception:
-                            pass
-                    elif cell_type == xlrd.XL_CELL_ERROR:
-                        if value in xlrd.biffh.error_text_from_code:
-                            value = xlrd.biffh.error_text_from_code[value]
-                        else:
-                            value = '#N/A'
-                    elif cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
-                        value = ''
-                    elif cell_type == xlrd.XL_CELL_BOOLEAN:
-                        value = ('false', 'true')[value]
-
+            for row, values in enumerate(self.sheet_rows(sheet)):
+                for col, value in enumerate(values):
                     rw = row + 1
                     cc = col + 1
-                    ws.cell(rw, cc).value = value
-                    font, fill, border, alignment, number_format, protection = self.xls_style_to_xlsx(
-                        sheet.cell_xf_index(row, col))
+                    cell = ws.cell(rw, cc)
+                    cell.value = value
+                    xf_ndx = sheet.cell_xf_index(row, col)
+                    font, fill, border, alignment, number_format, protection = self.cached_style(xf_ndx)
                     # if number_format != 'General':
                     # print(f'({rw},{cc}).number_format = {number_format}')
                     if isinstance(value, str):
                         if '\n' in value and not alignment.wrap_text:
-                            alignment = copy.deepcopy(alignment)
-                            alignment.wrap_text = True
+                            alignment = self.wrapped_alignment(xf_ndx, alignment)
                         if value[-1:] == '%' and number_format == 'General':
                             number_format = numbers.FORMAT_PERCENTAGE
                     elif isinstance(value, datetime):
@@ -294,24 +463,24 @@ class XLS2XLSX:
                     elif isinstance(value, timedelta):
                         if number_format == 'General':
                             number_format = '[h]:mm:ss'
-                    ws.cell(rw, cc).font = font
-                    ws.cell(rw, cc).fill = fill
-                    ws.cell(rw, cc).border = border
-                    ws.cell(rw, cc).alignment = alignment
+                    cell.font = font
+                    cell.fill = fill
+                    cell.border = border
+                    cell.alignment = alignment
                     # if number_format != 'General':
                     # print(f'({rw},{cc}).number_format = {number_format}, .value = {value}, type = {type(value)}')
-                    ws.cell(rw, cc).number_format = number_format
-                    ws.cell(rw, cc).protection = protection
+                    cell.number_format = number_format
+                    cell.protection = protection
                     if protection.locked or protection.hidden:
                         ws.protection.sheet = True
                     tup = (row, col)
                     if tup in sheet.hyperlink_map:
                         hyperlink = sheet.hyperlink_map[tup].url_or_path
-                        ws.cell(rw, cc).hyperlink = hyperlink
+                        cell.hyperlink = hyperlink
                         # ws.cell(rw, cc).style = 'Hyperlink'
                     if tup in sheet.cell_note_map:
                         comment = sheet.cell_note_map[tup]
-                        ws.cell(rw, cc).comment = Comment(comment.text, comment.author)
+                        cell.comment = Comment(comment.text, comment.author)
                     image = False  # FIXME (after fixing xlrd)
                     if image:
                         image.anchor = f'{cc}{rw}'
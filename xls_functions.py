@@ -1,3 +1,7 @@
+import bisect
+import hashlib
+import os
+import time
 import openpyxl
 from openpyxl.utils import get_column_letter
 from openpyxl import Workbook
@@ -20,13 +24,23 @@ COLOR_GREEN = '5AD208'
 COLOR_GREY = 'A6A6A6'
 COLOR_LIGHT_GREY = 'D9D9D9'
 
+XLS_CACHE_DIR = Path(__file__).resolve().parent / 'xls_cache'  # converted legacy .xls files, see init()
+XLS_CACHE_MAX_AGE_DAYS = 30
+XLS_CACHE_MAX_SIZE_MB = 1024
+XLS_CACHE_TMP_MAX_AGE_HOURS = 24  # temporary files of conversions killed midway
 
-def init(file: str | Path, create_on_error=False, **kwargs) -> openpyxl.Workbook:
+
+def init(file: str | Path, create_on_error=False, values_only=False, sheets=None, processes=None, use_cache=True,
+         **kwargs) -> openpyxl.Workbook:
     """
     Initializes an Excel workbook object.
 
     :param file: The path to the Excel file.
     :param create_on_error: If True, creates a new workbook if the file is not found.
+    :param values_only: If True, a legacy .xls file is converted without formatting (cell values only).
+    :param sheets: Sheet name or index, or a list of them, to convert from a legacy .xls file (default all).
+    :param processes: Number of worker processes to convert the sheets of a legacy .xls file in parallel.
+    :param use_cache: If True, a legacy .xls file is converted once and then loaded from the conversion cache.
     :return: The workbook object.
     :rtype: Workbook
     """
@@ -35,9 +49,16 @@ def init(file: str | Path, create_on_error=False, **kwargs) -> openpyxl.Workbook
     try:
         if file.suffix == '.xlsx':
             return openpyxl.load_workbook(file, **kwargs)
+        elif use_cache:
+            return openpyxl.load_workbook(convert_xls_cached(file, values_only=values_only, sheets=sheets,
+                                                             processes=processes), **kwargs)
         else:
             from xls2xlsx import XLS2XLSX
-            return XLS2XLSX(file).to_xlsx()
+            converter = XLS2XLSX(file, values_only=values_only, sheets=sheets)
+            try:
+                return converter.to_xlsx(processes=processes)
+            finally:
+                converter.close()
     except FileNotFoundError:
         if create_on_error:
             return openpyxl.Workbook()
@@ -45,6 +66,82 @@ def init(file: str | Path, create_on_error=False, **kwargs) -> openpyxl.Workbook
             raise FileNotFoundError
 
 
+def xls_cache_key(file: Path, **options) -> str:
+    """
+    Computes the conversion cache key of a file: a hash of its contents and the conversion options.
+
+    :param file: The path to the file.
+    :param options: The conversion options.
+    :return: The hex digest.
+    :rtype: str
+    """
+    with open(file, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha256')
+    digest.update(repr(sorted(options.items())).encode())
+    return digest.hexdigest()
+
+
+def convert_xls_cached(file: Path, values_only=False, sheets=None, processes=None, cache_dir=XLS_CACHE_DIR) -> Path:
+    """
+    Converts a legacy .xls file to .xlsx in the cache directory, unless the same contents were already converted
+    with the same options.
+
+    :param file: The path to the .xls file.
+    :param values_only: If True, converts cell values only.
+    :param sheets: Sheet name or index, or a list of them, to convert (default all).
+    :param processes: Number of worker processes to convert the sheets in parallel.
+    :param cache_dir: The cache directory.
+    :return: The path to the converted .xlsx file.
+    :rtype: Path
+    """
+    cached = Path(cache_dir) / f'{xls_cache_key(file, values_only=values_only, sheets=sheets)}.xlsx'
+    if cached.exists():
+        os.utime(cached)  # recently used files are evicted last
+        return cached
+
+    from xls2xlsx import XLS2XLSX
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = cached.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        converter = XLS2XLSX(file, values_only=values_only, sheets=sheets)
+        try:
+            converter.to_xlsx(filename=temp_file, processes=processes)
+        finally:
+            converter.close()
+        os.replace(temp_file, cached)  # concurrent runs never see a partially written file
+    finally:
+        temp_file.unlink(missing_ok=True)  # left only if the conversion failed
+    evict_xls_cache(cache_dir)
+    return cached
+
+
+def evict_xls_cache(cache_dir=XLS_CACHE_DIR, max_age_days=XLS_CACHE_MAX_AGE_DAYS, max_size_mb=XLS_CACHE_MAX_SIZE_MB):
+    """
+    Removes converted files not used for max_age_days, then the least recently used ones until the cache
+    fits into max_size_mb. Temporary files of conversions that did not finish are removed too.
+
+    :param cache_dir: The cache directory.
+    :param max_age_days: Maximum age of a cached file since it was last used.
+    :param max_size_mb: Maximum total size of the cache.
+    """
+    oldest_tmp_allowed = time.time() - XLS_CACHE_TMP_MAX_AGE_HOURS * 3600
+    for file in Path(cache_dir).glob('*.tmp'):
+        try:
+            if file.stat().st_mtime < oldest_tmp_allowed:  # newer ones may be written by a running conversion
+                file.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+    files = [(file, file.stat()) for file in Path(cache_dir).glob('*.xlsx')]
+    files.sort(key=lambda item: item[1].st_mtime)
+    total_size = sum(stat.st_size for _, stat in files)
+    oldest_allowed = time.time() - max_age_days * 24 * 3600
+    for file, stat in files:
+        if stat.st_mtime >= oldest_allowed and total_size <= max_size_mb * 1024 * 1024:
+            break
+        file.unlink(missing_ok=True)
+        total_size -= stat.st_size
+
+
 def get_active_sheet(file: str | Path, create_on_error=False, **kwargs) -> Worksheet:
     """
     Gets the active sheet in an Excel workbook.
@@ -404,3 +501,219 @@ def get_column_values(*, source: Path | str | Worksheet, column: str | int, excl
             value = value.lower()
         keywords.append(value)
     return list(set(keywords)) if unique else keywords
+
+
+class PriceTable:
+    """
+    In-memory columnar copy of a worksheet for merging prices.
+
+    The sheet is read once. Header names are mapped to column numbers once, and hash indexes on any set of columns
+    (composite keys like art + variant included) are built on first use and kept up to date on every write,
+    so lookups are O(1). Each index maps a key to all the rows that have it. Keys are compared as strings,
+    stripped and lowercased like in index_file(). Changed cells are written back with write_to().
+    """
+
+    def __init__(self, sh: Worksheet, first_data_row=FIRST_DATA_ROW, strip=True, lower=True):
+        """
+        :param sh: The worksheet object to load.
+        :param first_data_row: The starting row number for data (the header is in row 1).
+        :param strip: Whether to strip whitespace from key values.
+        :param lower: Whether to convert key values to lowercase.
+        """
+        self.first_data_row = first_data_row
+        self.strip = strip
+        self.lower = lower
+
+        self.header = dict()
+        for column, value in enumerate(next(sh.iter_rows(min_row=1, max_row=1, values_only=True), ()), start=1):
+            if value is not None:
+                self.header.setdefault(str(value).strip().lower(), column)
+
+        rows = list(sh.iter_rows(min_row=first_data_row, values_only=True))
+        width = max((len(row) for row in rows), default=0)
+        self.columns = [[row[i] if i < len(row) else None for row in rows] for i in range(width)]
+        self.row_count = len(rows)
+        self.indexes = dict()  # tuple of column numbers -> {key: sorted list of rows}
+        self.changed = set()  # (row, column) of the cells to write back to the sheet
+
+    @classmethod
+    def from_file(cls, file: str | Path, create_on_error=False, **kwargs) -> 'PriceTable':
+        """
+        Loads the active sheet of an Excel file.
+
+        :param file: The path to the Excel file.
+        :param create_on_error: If True, starts with an empty table if the file is not found.
+        :return: The table object.
+        :rtype: PriceTable
+        """
+        return cls(get_active_sheet(file, create_on_error, **kwargs))
+
+    @property
+    def max_row(self) -> int:
+        """The last row number, the same as Worksheet.max_row"""
+        return max(self.first_data_row + self.row_count - 1, 1)
+
+    def rows(self) -> range:
+        """The data row numbers"""
+        return range(self.first_data_row, self.first_data_row + self.row_count)
+
+    def column(self, column: int | str | list[str]) -> int | None:
+        """
+        Gets the column number by its header name(s) from the cached header map.
+
+        :param column: The column number, name or list of possible names.
+        :return: The column number, or None if not found.
+        :rtype: int
+        """
+        if isinstance(column, int):
+            return column
+        if isinstance(column, str):
+            column = [column]
+        for name in column:
+            if number := self.header.get(name.strip().lower()):
+                return number
+
+    def get(self, row: int, column: int | str):
+        """
+        Gets a cell value.
+
+        :param row: The row number.
+        :param column: The column number or name.
+        :return: The cell value, None for the rows and columns beyond the table.
+        :raises KeyError: If the column name is not in the header.
+        :raises IndexError: If the row is a header row.
+        """
+        column = self._column_number(column)
+        i = self._row_index(row)
+        if i < self.row_count and column <= len(self.columns):
+            return self.columns[column - 1][i]
+
+    def set(self, row: int, column: int | str, value):
+        """
+        Sets a cell value, updating the indexes on that column.
+
+        :param row: The row number.
+        :param column: The column number or name.
+        :param value: The value to set.
+        :raises KeyError: If the column name is not in the header.
+        :raises IndexError: If the row is a header row.
+        """
+        column = self._column_number(column)
+        self._row_index(row)
+        if row > self.max_row:
+            self._add_rows(row - self.max_row)
+        while len(self.columns) < column:
+            self.columns.append([None] * self.row_count)
+
+        affected = [columns for columns in self.indexes if column in columns]
+        for columns in affected:
+            self._remove_from_index(row, columns)
+        self.columns[column - 1][row - self.first_data_row] = value
+        for columns in affected:
+            self._add_to_index(row, columns)
+        self.changed.add((row, column))
+
+    def append_row(self) -> int:
+        """
+        Adds an empty row at the end of the table.
+
+        :return: The new row number.
+        :rtype: int
+        """
+        self._add_rows(1)
+        return self.max_row
+
+    def index(self, *columns: int | str) -> dict:
+        """
+        Gets the index on the given columns, building it on first use.
+
+        :param columns: The column numbers or names of the key.
+        :return: A dictionary where keys are values (a tuple for several columns) and values are lists of rows.
+        :rtype: dict
+        """
+        columns = tuple(self._column_number(column) for column in columns)
+        if columns not in self.indexes:
+            self.indexes[columns] = dict()
+            for row in self.rows():
+                self._add_to_index(row, columns)
+        return self.indexes[columns]
+
+    def find_rows(self, value, *columns: int | str) -> list[int]:
+        """
+        Finds all the rows having the value in the given columns.
+
+        :param value: The value to look up, a tuple of values for several columns.
+        :param columns: The column numbers or names of the key.
+        :return: A list of row numbers.
+        :rtype: list[int]
+        """
+        key = self._key(value if len(columns) > 1 else (value,))
+        return self.index(*columns).get(key, []) if key is not None else []
+
+    def find_row(self, value, *columns: int | str) -> int | None:
+        """
+        Finds the first row having the value in the given columns.
+
+        :param value: The value to look up, a tuple of values for several columns.
+        :param columns: The column numbers or names of the key.
+        :return: The row number, or None if not found.
+        """
+        rows = self.find_rows(value, *columns)
+        return rows[0] if rows else None
+
+    def write_to(self, sh: Worksheet):
+        """
+        Writes the changed cells to a worksheet.
+
+        :param sh: The worksheet object.
+        """
+        for row, column in sorted(self.changed):
+            sh.cell(row, column).value = self.get(row, column)
+        self.changed.clear()
+
+    def _column_number(self, column: int | str | list[str]) -> int:
+        number = self.column(column)
+        if number is None:
+            raise KeyError(f'Column {column} is not in the header')
+        if number < 1:
+            raise KeyError(f'Column number {number} is less than 1')
+        return number
+
+    def _row_index(self, row: int) -> int:
+        if row < self.first_data_row:
+            raise IndexError(f'Row {row} is above the first data row {self.first_data_row}')
+        return row - self.first_data_row
+
+    def _add_rows(self, count: int):
+        for values in self.columns:
+            values.extend([None] * count)
+        self.row_count += count
+
+    def _normalize(self, value) -> str | None:
+        if not value:
+            return None
+        value = str(value)
+        if self.strip:
+            value = value.strip()
+        if self.lower:
+            value = value.lower()
+        return value
+
+    def _key(self, values) -> str | tuple | None:
+        key = tuple(self._normalize(value) for value in values)
+        if all(part is None for part in key):
+            return None
+        return key[0] if len(key) == 1 else key
+
+    def _add_to_index(self, row: int, columns: tuple):
+        key = self._key(self.get(row, column) for column in columns)
+        if key is not None:
+            bisect.insort(self.indexes[columns].setdefault(key, []), row)
+
+    def _remove_from_index(self, row: int, columns: tuple):
+        key = self._key(self.get(row, column) for column in columns)
+        if key is not None:
+            rows = self.indexes[columns][key]
+            rows.remove(row)
+            if not rows:
+                del self.indexes[columns][key]